@@ -0,0 +1,215 @@
+"""
+Long-horizon analytics over a user's whole history.
+
+Notes are extracted once into columnar NumPy arrays (date ordinals,
+sentiment, mode, a note x symptom count matrix) and kept as a derived index
+of the note store, so the arrays are cached per user version and a save
+appends rows instead of re-extracting. Archived months contribute stored
+summaries holding just those fields, so a rebuild does not decompress them.
+Everything below is computed with
+vectorized array operations over those columns: rolling 7/30/90-day
+sentiment, day-of-week effects, weekly symptom frequency and streak history.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from storage import notes as note_store
+
+INDEX_NAME = "history"
+ROLLING_WINDOWS = (7, 30, 90)
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def _ordinal(value):
+    try:
+        return date.fromisoformat(value[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+class Columns:
+    """Column arrays of one user's dated notes, archived months first. Never mutated after construction."""
+
+    __slots__ = ("ids", "ordinals", "sentiment", "modes", "mode_names",
+                 "symptoms", "symptom_names")
+
+    @classmethod
+    def from_notes(cls, notes):
+        return cls.empty().extended(notes)
+
+    @classmethod
+    def empty(cls):
+        cols = cls()
+        cols.ids = frozenset()
+        cols.ordinals = np.zeros(0, dtype=np.int32)
+        cols.sentiment = np.zeros(0, dtype=np.float64)
+        cols.modes = np.zeros(0, dtype=np.int16)
+        cols.mode_names = ()
+        cols.symptoms = np.zeros((0, 0), dtype=np.uint16)
+        cols.symptom_names = ()
+        return cols
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def extended(self, notes):
+        """A new Columns with ``notes`` appended as rows."""
+        ordinals, sentiment, modes, rows = [], [], [], []
+        mode_index = {name: i for i, name in enumerate(self.mode_names)}
+        symptom_index = {name: i for i, name in enumerate(self.symptom_names)}
+        for note in notes:
+            ordinal = _ordinal(note.get("date"))
+            if ordinal is None:
+                continue
+            ordinals.append(ordinal)
+            value = (note.get("diary") or {}).get("sentiment")
+            sentiment.append(np.nan if value is None else float(value))
+            modes.append(mode_index.setdefault(note.get("mode"), len(mode_index)))
+            rows.append([symptom_index.setdefault(s, len(symptom_index))
+                         for s in (note.get("medical_entities") or {}).get("symptoms", [])])
+
+        cols = Columns()
+        cols.ids = self.ids | {n["id"] for n in notes if n.get("id")}
+        cols.mode_names = tuple(mode_index)
+        cols.symptom_names = tuple(symptom_index)
+        cols.ordinals = np.concatenate([self.ordinals, np.asarray(ordinals, dtype=np.int32)])
+        cols.sentiment = np.concatenate([self.sentiment, np.asarray(sentiment, dtype=np.float64)])
+        cols.modes = np.concatenate([self.modes, np.asarray(modes, dtype=np.int16)])
+        matrix = np.zeros((len(cols.ordinals), len(symptom_index)), dtype=np.uint16)
+        matrix[:len(self), :self.symptoms.shape[1]] = self.symptoms
+        if rows:
+            row_idx = np.repeat(np.arange(len(self), len(cols.ordinals)), [len(r) for r in rows])
+            col_idx = np.fromiter((c for r in rows for c in r), dtype=np.int64, count=len(row_idx))
+            np.add.at(matrix, (row_idx, col_idx), 1)
+        cols.symptoms = matrix
+        return cols
+
+    def mode_mask(self, mode):
+        if mode is None:
+            return np.ones(len(self), dtype=bool)
+        if mode not in self.mode_names:
+            return np.zeros(len(self), dtype=bool)
+        return self.modes == self.mode_names.index(mode)
+
+
+def _summarize(notes):
+    """The fields Columns reads, per note."""
+    return [{"id": n.get("id"), "date": n.get("date"), "mode": n.get("mode"),
+             "diary": {"sentiment": (n.get("diary") or {}).get("sentiment")},
+             "medical_entities": {"symptoms": (n.get("medical_entities") or {}).get("symptoms", [])}}
+            for n in notes]
+
+
+def _build(query, summaries):
+    archived = [note for _, notes in summaries for note in notes]
+    return Columns.from_notes(archived + query()[::-1])
+
+
+def _apply(cols, notes):
+    if any(n.get("id") in cols.ids for n in notes):
+        return None
+    return cols.extended(notes)
+
+
+note_store.register_index(INDEX_NAME, _build, _apply, summarize=_summarize)
+
+
+def columns(username):
+    return note_store.derived(username, INDEX_NAME)
+
+
+# -----------------------------------------------------------------------------
+# Vectorized views
+# -----------------------------------------------------------------------------
+def _daily_sentiment(cols):
+    """Per-day (first ordinal, sum, count) arrays over the full date span of scored notes."""
+    scored = ~np.isnan(cols.sentiment)
+    ordinals = cols.ordinals[scored]
+    if not len(ordinals):
+        return None, None, None
+    start = int(ordinals.min())
+    offsets = ordinals - start
+    sums = np.bincount(offsets, weights=cols.sentiment[scored])
+    counts = np.bincount(offsets)
+    return start, sums, counts
+
+
+def rolling_sentiment(cols, windows=ROLLING_WINDOWS):
+    """
+    Trailing mean sentiment over each window (in days), one row per calendar
+    day from the first to the last scored entry. Days without any entry in
+    the window are NaN.
+    """
+    start, sums, counts = _daily_sentiment(cols)
+    if start is None:
+        return pd.DataFrame(columns=[f"{w}d" for w in windows])
+    csum = np.concatenate([[0.0], np.cumsum(sums)])
+    ccount = np.concatenate([[0], np.cumsum(counts)])
+    idx = np.arange(1, len(sums) + 1)
+    data = {}
+    for w in windows:
+        lo = np.maximum(idx - w, 0)
+        n = ccount[idx] - ccount[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            data[f"{w}d"] = np.where(n > 0, (csum[idx] - csum[lo]) / n, np.nan)
+    index = pd.to_datetime(np.arange(start, start + len(sums)) - 719163, unit="D")
+    return pd.DataFrame(data, index=index)
+
+
+def weekday_effects(cols):
+    """Mean sentiment and number of scored entries per day of week (Mon..Sun)."""
+    scored = ~np.isnan(cols.sentiment)
+    weekday = (cols.ordinals[scored] - 1) % 7
+    counts = np.bincount(weekday, minlength=7)
+    sums = np.bincount(weekday, weights=cols.sentiment[scored], minlength=7)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return pd.DataFrame({"mean_sentiment": means, "entries": counts}, index=list(WEEKDAYS))
+
+
+def weekly_symptoms(cols, top=None, weeks=None):
+    """
+    Symptom mentions per ISO-style week (starting Monday), one column per
+    symptom ordered by total mentions. ``top`` keeps the most frequent
+    symptoms, ``weeks`` the latest weeks.
+    """
+    if not len(cols) or not cols.symptom_names:
+        return pd.DataFrame()
+    week = (cols.ordinals - 1) // 7
+    first = int(week.min())
+    span = int(week.max()) - first + 1
+    order = np.argsort(week, kind="stable")
+    sorted_week = week[order] - first
+    boundaries = np.flatnonzero(np.diff(np.concatenate([[-1], sorted_week])))
+    per_week = np.add.reduceat(cols.symptoms[order].astype(np.int64), boundaries, axis=0)
+    table = np.zeros((span, len(cols.symptom_names)), dtype=np.int64)
+    table[sorted_week[boundaries]] = per_week
+    totals = table.sum(axis=0)
+    keep = np.argsort(-totals, kind="stable")
+    if top is not None:
+        keep = keep[:top]
+    if weeks is not None:
+        table = table[-weeks:]
+        first += span - len(table)
+    index = pd.to_datetime((np.arange(first, first + len(table)) * 7 + 1) - 719163, unit="D")
+    return pd.DataFrame(table[:, keep], index=index,
+                        columns=[cols.symptom_names[i] for i in keep])
+
+
+def streak_history(cols, min_length=1):
+    """Runs of consecutive days with at least one entry: start, end, length (days)."""
+    if not len(cols):
+        return pd.DataFrame(columns=["start", "end", "days"])
+    days = np.unique(cols.ordinals)
+    breaks = np.flatnonzero(np.diff(days) != 1)
+    starts = days[np.concatenate([[0], breaks + 1])]
+    ends = days[np.concatenate([breaks, [len(days) - 1]])]
+    lengths = ends - starts + 1
+    keep = lengths >= min_length
+    return pd.DataFrame({
+        "start": [date.fromordinal(int(o)) for o in starts[keep]],
+        "end": [date.fromordinal(int(o)) for o in ends[keep]],
+        "days": lengths[keep],
+    })
@@ -0,0 +1,184 @@
+"""
+Per-user daily rollup: one record per calendar day with the entry count,
+sentiment mean/min/max, symptom counts and mode counts.
+
+Registered as a derived index of the note store, so it is built once and
+then updated by each save; streaks, charts, dashboard cards and reports read
+it in O(days shown) and never parse dates at render time. The days of each
+archived month are stored as a summary next to the archive, so a rebuild
+only aggregates the hot tier.
+"""
+import bisect
+from collections import Counter
+from datetime import date, timedelta
+
+from storage import notes as note_store
+
+INDEX_NAME = "daily"
+
+
+class Day:
+    """Aggregates for one date. Treated as immutable once published in a Rollup."""
+
+    __slots__ = ("date", "count", "ids", "sentiment_sum", "sentiment_n",
+                 "sentiment_min", "sentiment_max", "symptoms", "modes")
+
+    def __init__(self, day):
+        self.date = day
+        self.count = 0
+        self.ids = frozenset()
+        self.sentiment_sum = 0.0
+        self.sentiment_n = 0
+        self.sentiment_min = None
+        self.sentiment_max = None
+        self.symptoms = Counter()
+        self.modes = Counter()
+
+    @property
+    def sentiment_mean(self):
+        return self.sentiment_sum / self.sentiment_n if self.sentiment_n else None
+
+    def with_note(self, note):
+        day = Day(self.date)
+        day.count = self.count + 1
+        day.ids = self.ids | {note["id"]}
+        day.sentiment_sum = self.sentiment_sum
+        day.sentiment_n = self.sentiment_n
+        day.sentiment_min = self.sentiment_min
+        day.sentiment_max = self.sentiment_max
+        sentiment = (note.get("diary") or {}).get("sentiment")
+        if sentiment is not None:
+            sentiment = float(sentiment)
+            day.sentiment_sum += sentiment
+            day.sentiment_n += 1
+            day.sentiment_min = sentiment if day.sentiment_min is None else min(day.sentiment_min, sentiment)
+            day.sentiment_max = sentiment if day.sentiment_max is None else max(day.sentiment_max, sentiment)
+        day.symptoms = self.symptoms + Counter((note.get("medical_entities") or {}).get("symptoms", []))
+        day.modes = self.modes + Counter([note.get("mode")])
+        return day
+
+    def summary(self):
+        """The day as JSON, for the archived-month summaries."""
+        return {"count": self.count, "ids": sorted(self.ids),
+                "sentiment": [self.sentiment_sum, self.sentiment_n, self.sentiment_min, self.sentiment_max],
+                "symptoms": dict(self.symptoms), "modes": [[mode, n] for mode, n in self.modes.items()]}
+
+    @classmethod
+    def from_summary(cls, key, data):
+        day = cls(key)
+        day.count = data["count"]
+        day.ids = frozenset(data["ids"])
+        day.sentiment_sum, day.sentiment_n, day.sentiment_min, day.sentiment_max = data["sentiment"]
+        day.symptoms = Counter(data["symptoms"])
+        day.modes = Counter({mode: n for mode, n in data["modes"]})
+        return day
+
+
+class Rollup:
+    __slots__ = ("days", "dates", "total")
+
+    def __init__(self):
+        self.days = {}    # "YYYY-MM-DD" -> Day
+        self.dates = []   # sorted keys of days
+        self.total = 0
+
+    def copy(self):
+        rollup = Rollup()
+        rollup.days = dict(self.days)
+        rollup.dates = list(self.dates)
+        rollup.total = self.total
+        return rollup
+
+    def add(self, note):
+        key = note.get("date")
+        if not key:
+            return
+        day = self.days.get(key)
+        if day is None:
+            day = Day(key)
+            if not self.dates or self.dates[-1] < key:
+                self.dates.append(key)
+            else:
+                bisect.insort(self.dates, key)
+        self.days[key] = day.with_note(note)
+        self.total += 1
+
+    def range(self, since=None, until=None):
+        """Days with entries in ``[since, until]`` (``YYYY-MM-DD``), oldest first."""
+        lo = 0 if since is None else bisect.bisect_left(self.dates, since)
+        hi = len(self.dates) if until is None else bisect.bisect_right(self.dates, until)
+        return [self.days[key] for key in self.dates[lo:hi]]
+
+    def last(self, limit, mode=None):
+        """The latest ``limit`` days with an entry of ``mode`` (any mode if None), oldest first."""
+        out = []
+        for key in reversed(self.dates):
+            day = self.days[key]
+            if mode is None or day.modes.get(mode):
+                out.append(day)
+                if len(out) >= limit:
+                    break
+        return out[::-1]
+
+    def streak(self, today):
+        """Consecutive days with an entry ending today or yesterday."""
+        current = today if today.isoformat() in self.days else today - timedelta(days=1)
+        streak = 0
+        while current.isoformat() in self.days:
+            streak += 1
+            current -= timedelta(days=1)
+        return streak
+
+
+def _summarize(notes):
+    rollup = Rollup()
+    for note in notes:
+        rollup.add(note)
+    return {key: day.summary() for key, day in rollup.days.items()}
+
+
+def _build(query, summaries):
+    rollup = Rollup()
+    for _, days in summaries:
+        for key in sorted(days):
+            day = rollup.days[key] = Day.from_summary(key, days[key])
+            rollup.dates.append(key)
+            rollup.total += day.count
+    for note in reversed(query()):
+        rollup.add(note)
+    return rollup
+
+
+def _apply(rollup, notes):
+    for note in notes:
+        day = rollup.days.get(note.get("date"))
+        if day is not None and note["id"] in day.ids:
+            # An edit of a counted note; recount from scratch.
+            return None
+    rollup = rollup.copy()
+    for note in notes:
+        rollup.add(note)
+    return rollup
+
+
+note_store.register_index(INDEX_NAME, _build, _apply, summarize=_summarize)
+
+
+def rollup(username):
+    return note_store.derived(username, INDEX_NAME)
+
+
+def days(username, since=None, until=None):
+    if isinstance(since, date):
+        since = since.isoformat()
+    if isinstance(until, date):
+        until = until.isoformat()
+    return rollup(username).range(since, until)
+
+
+def streak(username, today=None):
+    return rollup(username).streak(today or date.today())
+
+
+def total_entries(username):
+    return rollup(username).total
@@ -0,0 +1,98 @@
+"""
+Sliding-window mood and symptom trends over the latest diary entries.
+
+The window keeps running sums for the least-squares slope (sum of y and of
+x*y, with x the position in the window) and a Counter of symptoms, so
+adding an entry and evicting the oldest are O(1) and reading the trend
+needs no refit. It is registered as a derived index of the note store, so
+every save moves it forward.
+"""
+from collections import Counter, deque
+
+from storage import notes as note_store
+
+WINDOW = 14
+INDEX_NAME = "trends"
+
+
+class TrendWindow:
+    __slots__ = ("entries", "sum_y", "sum_xy", "symptoms")
+
+    def __init__(self):
+        self.entries = deque()   # (note id, sentiment, symptoms), oldest first
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.symptoms = Counter()
+
+    def copy(self):
+        window = TrendWindow()
+        window.entries = deque(self.entries)
+        window.sum_y = self.sum_y
+        window.sum_xy = self.sum_xy
+        window.symptoms = Counter(self.symptoms)
+        return window
+
+    def push(self, note):
+        sentiment = float(note.get("diary", {}).get("sentiment", 0.0))
+        symptoms = list(note.get("medical_entities", {}).get("symptoms", []))
+        if len(self.entries) == WINDOW:
+            _, old_y, old_symptoms = self.entries.popleft()
+            # Every remaining entry moves one position left.
+            self.sum_y -= old_y
+            self.sum_xy -= self.sum_y
+            self.symptoms.subtract(old_symptoms)
+            self.symptoms += Counter()  # drops the zero counts
+        self.sum_xy += len(self.entries) * sentiment
+        self.sum_y += sentiment
+        self.entries.append((note["id"], sentiment, symptoms))
+        self.symptoms.update(symptoms)
+
+    def summary(self):
+        n = len(self.entries)
+        if n == 0:
+            return {}
+        slope = 0.0
+        if n > 1:
+            sum_x = n * (n - 1) / 2
+            sum_xx = (n - 1) * n * (2 * n - 1) / 6
+            slope = (n * self.sum_xy - sum_x * self.sum_y) / (n * sum_xx - sum_x * sum_x)
+        # Ties keep first-seen order, matching a Counter built over the window.
+        order = {}
+        for _, _, symptoms in self.entries:
+            for symptom in symptoms:
+                order.setdefault(symptom, len(order))
+        top = sorted(self.symptoms.items(), key=lambda kv: (-kv[1], order[kv[0]]))[:5]
+        return {
+            "sentiment_slope": float(slope),
+            "sentiment_avg": self.sum_y / n,
+            "top_symptoms": top,
+            "total_notes": n,
+        }
+
+
+def _build(query):
+    window = TrendWindow()
+    for note in reversed(query(mode="diary", limit=WINDOW)):
+        window.push(note)
+    return window
+
+
+def _apply(window, notes):
+    diary = [n for n in notes if n.get("mode") == "diary"]
+    if not diary:
+        return window
+    held = {entry[0] for entry in window.entries}
+    if any(n["id"] in held for n in diary):
+        return None
+    window = window.copy()
+    for note in diary:
+        window.push(note)
+    return window
+
+
+note_store.register_index(INDEX_NAME, _build, _apply)
+
+
+def trends(username):
+    """Slope and mean of the sentiment and the top symptoms over the last WINDOW diary entries."""
+    return note_store.derived(username, INDEX_NAME).summary()
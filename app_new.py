@@ -7,10 +7,8 @@
 # pip install spacy
 # pip install https://s3-us-west-2.amazonaws.com/ai2-s2-scispacy/releases/v0.5.4/en_core_sci_sm-0.5.4.tar.gz
 
-import bcrypt
 import streamlit as st
 import os
-import json
 import base64
 import time
 from datetime import datetime, timedelta
@@ -110,12 +108,6 @@ HAS_MIC_RECORDER = False
 # -----------------------------------------------------------------------------
 # Optional Dependency Loading (Graceful Degradation)
 # -----------------------------------------------------------------------------
-try:
-    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-    HAS_VADER = True
-except ImportError:
-    HAS_VADER = False
-
 try:
     import whisper
     HAS_WHISPER = True
@@ -128,12 +120,6 @@ try:
 except ImportError:
     HAS_SR = False
 
-try:
-    import spacy
-    HAS_SPACY = True
-except ImportError:
-    HAS_SPACY = False
-
 # -----------------------------------------------------------------------------
 # Configuration & Styling
 # -----------------------------------------------------------------------------
@@ -569,6 +555,9 @@ if "show_checkin_results" not in st.session_state:
     st.session_state["show_checkin_results"] = False
 if "last_checkin_result" not in st.session_state:
     st.session_state["last_checkin_result"] = None
+if "saved_message_count" not in st.session_state:
+    # How many of st.session_state["messages"] are already in storage
+    st.session_state["saved_message_count"] = 0
 if "active_session_id" not in st.session_state:
     import uuid
     st.session_state["active_session_id"] = str(uuid.uuid4())
@@ -609,18 +598,22 @@ def render_empty_state(message, icon="ℹ️", cta=None):
 # -----------------------------------------------------------------------------
 # Auth & File Storage Functions
 # -----------------------------------------------------------------------------
-import bcrypt
+import auth
 import os
-import json
-
-USERS_DB_FILE = "data/users_db.json"
 
-def user_data_dir(username):
-    # Sanitize username (allow only letters, numbers, underscore)
-    safe_name = "".join([c for c in username if c.isalnum() or c == '_'])
-    path = os.path.join("data", "users", safe_name)
-    os.makedirs(path, exist_ok=True)
-    return path
+from storage import notes as note_store
+from storage import sessions as session_store
+from storage.paths import user_data_dir
+from storage.users import create_user, get_user
+from storage.write_behind import WriteBehindError
+from analytics import history as history_store
+from analytics import rollup as rollup_store
+from analytics import trends as trend_store
+from nlp import cache as analysis_cache
+from nlp import keywords, ner, ner_worker, pipeline
+from search import fulltext as search_store
+from search import related as related_store
+from search import retrieval
 
 def render_auto_mic(key="auto_mic"):
     """
@@ -732,109 +725,92 @@ def render_auto_mic(key="auto_mic"):
     # but the ACTUAL value comes back through the 'key' in session state.
     return st.session_state.get(key)
 
-def user_notes_path(username):
-    return os.path.join(user_data_dir(username), "notes.json")
-
-def load_notes():
+def query_notes(mode=None, since=None, until=None, limit=None, newest_first=False):
+    """Notes for the current user, filtered by the storage engine (see storage.notes.query_notes)."""
     if not st.session_state.get("is_authenticated"):
         return []
-    path = user_notes_path(st.session_state["username"])
-    if not os.path.exists(path):
-        return []
-    with open(path, "r") as f:
-        try:
-            return json.load(f)
-        except:
-            return []
+    return note_store.query_notes(st.session_state["username"], mode=mode, since=since,
+                                  until=until, limit=limit, newest_first=newest_first)
 
 def save_note(note):
     if not st.session_state.get("is_authenticated"):
         return
-    notes = load_notes()
-    
-    # If the note has an ID (like a chat session), update it if it exists
-    updated = False
-    if "id" in note:
-        for i, existing in enumerate(notes):
-            if existing.get("id") == note["id"]:
-                notes[i] = note
-                updated = True
-                break
-                
-    if not updated:
-        notes.append(note)
-        
-    path = user_notes_path(st.session_state["username"])
-    with open(path, "w") as f:
-        json.dump(notes, f, indent=2)
+    # Notes with an existing ID (like a chat session) are appended as a new
+    # version; readers only see the latest one.
+    try:
+        note_store.submit_note(st.session_state["username"], note)
+    except WriteBehindError as e:
+        st.error(f"Your note could not be saved right now ({e.__cause__ or e}). Please try again later.")
+        return
+    invalidate_context_cache()
+
+def memoized(key, compute):
+    """
+    Per-session memo of values derived from the user's notes. Entries are
+    keyed by the notes version as well, so a write from anywhere (another
+    tab, a background flush) also makes them stale.
+    """
+    username = st.session_state["username"]
+    scope = (username, note_store.notes_version(username))
+    cache = st.session_state.get("context_cache")
+    if cache is None or cache["scope"] != scope:
+        cache = st.session_state["context_cache"] = {"scope": scope, "values": {}}
+    values = cache["values"]
+    if key not in values:
+        if len(values) >= 32:
+            values.clear()
+        values[key] = compute()
+    return values[key]
+
+def invalidate_context_cache():
+    st.session_state.pop("context_cache", None)
 
 def save_current_chat_session():
-    """Saves the current `st.session_state["messages"]` to the notes database."""
+    """Appends the messages added since the last save to the active chat session."""
     if not st.session_state.get("is_authenticated") or not st.session_state.get("messages"):
         return
-        
+    
+    messages = st.session_state["messages"]
+    new_messages = messages[st.session_state["saved_message_count"]:]
+    if not new_messages:
+        return
+    
     # Generate a brief title from the first user message
     title = "New Conversation"
-    for msg in st.session_state["messages"]:
+    for msg in messages:
         if msg["role"] == "user":
             title = msg["content"][:30] + ("..." if len(msg["content"]) > 30 else "")
             break
-            
-    session_note = {
-        "id": st.session_state["active_session_id"],
-        "timestamp": datetime.now().isoformat(),
-        "date": datetime.today().strftime("%Y-%m-%d"),
-        "mode": "chat_session",
-        "title": title,
-        "messages": st.session_state["messages"]
-    }
-    save_note(session_note)
+    
+    try:
+        session_store.append_messages(st.session_state["username"], st.session_state["active_session_id"], new_messages, title)
+    except WriteBehindError as e:
+        # Left unsaved; the next save retries these messages.
+        st.error(f"This conversation could not be saved right now ({e.__cause__ or e}).")
+        return
+    st.session_state["saved_message_count"] = len(messages)
 
 def clear_local_history():
     if not st.session_state.get("is_authenticated"):
         return
-    path = user_notes_path(st.session_state["username"])
-    if os.path.exists(path):
-        os.remove(path)
+    note_store.clear_notes(st.session_state["username"])
+    session_store.clear_sessions(st.session_state["username"])
+    invalidate_context_cache()
     st.session_state["notes_db"] = []
     st.session_state["messages"] = []
-
-def load_users_db():
-    os.makedirs("data", exist_ok=True)
-    if not os.path.exists(USERS_DB_FILE):
-        with open(USERS_DB_FILE, "w") as f:
-            json.dump({}, f)
-        return {}
-    with open(USERS_DB_FILE, "r") as f:
-        try:
-            return json.load(f)
-        except:
-            return {}
-
-def save_users_db(db):
-    os.makedirs("data", exist_ok=True)
-    with open(USERS_DB_FILE, "w") as f:
-        json.dump(db, f, indent=2)
+    st.session_state["saved_message_count"] = 0
 
 
 
 # -----------------------------------------------------------------------------
 # Privacy / Redaction Functions
 # -----------------------------------------------------------------------------
-def redact_phi(text):
-    if not text: return text
-    text = re.sub(r'[\w\.-]+@[\w\.-]+\.\w+', '[REDACTED_EMAIL]', text)
-    text = re.sub(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}', '[REDACTED_PHONE]', text)
-    text = re.sub(r'(?i)(dob|date of birth|birthdate)[\s:]*\d{1,4}[-/]\d{1,2}[-/]\d{1,4}', r'\1: [REDACTED_DOB]', text)
-    text = re.sub(r'(?i)(patient name|name)[\s:]+([A-Z][a-z]+ [A-Z][a-z]+)', r'\1: [REDACTED_NAME]', text)
-    return text
+HTML_TAG = re.compile('<.*?>')
 
 def clean_html(raw_html):
     """Removes HTML tags from a string for safe text display."""
     if not raw_html: return ""
-    cleanr = re.compile('<.*?>')
-    cleantext = re.sub(cleanr, '', str(raw_html))
-    return cleantext
+    return HTML_TAG.sub('', str(raw_html))
 
 # -----------------------------------------------------------------------------
 # Audio & Speech-to-Text (Browser-based)
@@ -908,48 +884,28 @@ def transcribe_audio_bytes(audio_bytes):
 # -----------------------------------------------------------------------------
 # Medical NER (SciSpacy + Keyword Fallback)
 # -----------------------------------------------------------------------------
+# Entities come from the shared NER worker (python -m nlp.ner_worker) when one
+# is running; otherwise the model loads in the background from process start,
+# and the spinner only shows if a request arrives before that has finished.
+if ner_worker.client() is None:
+    ner.warm_up()
+
 @st.cache_resource(show_spinner="Loading SciSpacy Model...")
 def load_ner_model():
-    if HAS_SPACY:
+    return ner.load_model()
+
+def analyze_text(text, stages=pipeline.STAGES):
+    """Redaction, entities, sentiment, tags and red flags in one pass (see nlp.pipeline)."""
+    # Privacy mode stores nothing, and that includes the analysis cache's disk tier.
+    cache = None if st.session_state.get("privacy_mode", False) else analysis_cache.shared()
+    worker = ner_worker.client() if "ner" in stages else None
+    if worker is not None:
         try:
-            return spacy.load("en_core_sci_sm")
-        except:
-            return None
-    return None
-
-def extract_medical_concepts(text):
-    entities = {
-        "symptoms": set(), "conditions": set(),
-        "medications": set(), "vitals": set(), "procedures": set()
-    }
-    text_lower = text.lower()
-    
-    bp_matches = re.findall(r'\b\d{2,3}/\d{2,3}\b', text)
-    if bp_matches: entities["vitals"].update([f"BP: {m}" for m in bp_matches])
-    temp_matches = re.findall(r'\b(temp(erature)?|t)\s*[:=]?\s*(\d{2,3}(\.\d)?)\b', text_lower)
-    if temp_matches: entities["vitals"].update([f"Temp: {t[2]}" for t in temp_matches])
-    hr_matches = re.findall(r'\b(hr|pulse|heart rate)\s*[:=]?\s*(\d{2,3})\b', text_lower)
-    if hr_matches: entities["vitals"].update([f"HR: {h[1]}" for h in hr_matches])
-
-    nlp = load_ner_model()
-    if nlp:
-        doc = nlp(text)
-        for ent in doc.ents:
-            e_text = ent.text.lower()
-            if any(x in e_text for x in ["pain", "ache", "fever", "cough", "nausea", "fatigue", "tired"]):
-                entities["symptoms"].add(ent.text)
-            elif any(x in e_text for x in ["mg", "ml", "tablet", "aspirin", "ibuprofen", "tylenol", "dose"]):
-                entities["medications"].add(ent.text)
-            elif any(x in e_text for x in ["surgery", "x-ray", "mri", "scan", "test", "biopsy"]):
-                entities["procedures"].add(ent.text)
-            else:
-                entities["conditions"].add(ent.text)
-                
-    fallback_symptoms = ["headache", "fever", "chills", "nausea", "vomiting", "dizziness", "shortness of breath", "fatigue", "pain"]
-    for s in fallback_symptoms:
-        if s in text_lower: entities["symptoms"].add(s)
-            
-    return {k: sorted(list(v)) for k, v in entities.items()}
+            return pipeline.analyze(text, stages=stages, cache=cache, worker=worker)
+        except ner_worker.WorkerUnavailable:
+            pass  # Worker went down; use the in-process model below.
+    return pipeline.analyze(text, nlp=load_ner_model() if "ner" in stages else None, stages=stages,
+                            cache=cache)
 
 # -----------------------------------------------------------------------------
 # Advanced Analysis Logic
@@ -990,47 +946,20 @@ def calculate_quality_score(raw_text, soap_text):
         
     return max(0, score), checks, missing
 
-def find_related_diary_entries(soap_entities, notes):
-    related = []
+def find_related_diary_entries(soap_entities):
+    """Up to 3 diary entries from the last 14 days that mention a SOAP symptom or condition."""
     if not soap_entities.get("symptoms") and not soap_entities.get("conditions"):
-        return related
-        
-    search_terms = set([x.lower() for x in soap_entities.get("symptoms", []) + soap_entities.get("conditions", [])])
-    now = datetime.today()
-    
-    for n in reversed(notes):
-        if n.get("mode") == "diary":
-            try:
-                date_obj = datetime.strptime(n.get("date", "1970-01-01"), "%Y-%m-%d")
-            except:
-                continue
-            if (now - date_obj).days <= 14:
-                diary_tags_and_text = set([t.lower() for t in n.get("diary", {}).get("tags", [])] + n['raw_text_redacted'].lower().split())
-                if search_terms.intersection(diary_tags_and_text):
-                    related.append(n)
-                    if len(related) >= 3: break
-    return related
-
-def analyze_trends(diary_notes):
-    if not diary_notes: return {}
-    recent_notes = diary_notes[-14:]
-    
-    sentiments = [n["diary"]["sentiment"] for n in recent_notes]
-    slope = np.polyfit(range(len(sentiments)), sentiments, 1)[0] if len(sentiments) > 1 else 0
-        
-    symptoms = []
-    for n in recent_notes:
-        symptoms.extend(n.get("medical_entities", {}).get("symptoms", []))
-    
-    from collections import Counter
-    sym_counts = Counter(symptoms)
-    
-    return {
-        "sentiment_slope": float(slope),
-        "sentiment_avg": float(np.mean(sentiments)) if sentiments else 0.0,
-        "top_symptoms": sym_counts.most_common(5),
-        "total_notes": len(recent_notes)
-    }
+        return []
+    if not st.session_state.get("is_authenticated"):
+        return []
+    search_terms = soap_entities.get("symptoms", []) + soap_entities.get("conditions", [])
+    return related_store.related_entries(st.session_state["username"], search_terms, days=14, limit=3)
+
+def analyze_trends():
+    """Trend over the last 14 diary entries, read from the incrementally maintained window."""
+    if not st.session_state.get("is_authenticated"):
+        return {}
+    return memoized("trends", lambda: trend_store.trends(st.session_state["username"]))
 
 def generate_risk_alerts(trends):
     alerts = []
@@ -1093,22 +1022,6 @@ def process_soap(text):
     messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": text}]
     return generate_ai_response(messages, temp=0.2)
 
-def process_diary_logic(text):
-    analyzer = SentimentIntensityAnalyzer() if HAS_VADER else None
-    sentiment = analyzer.polarity_scores(text)["compound"] if analyzer else 0.0
-    
-    text_lower = text.lower()
-    tags = set()
-    if any(w in text_lower for w in ["pain", "headache", "fever", "cough"]): tags.add("symptoms")
-    if any(w in text_lower for w in ["ate", "food", "lunch", "dinner"]): tags.add("food")
-    if any(w in text_lower for w in ["happy", "sad", "stressed", "anxious"]): tags.add("mood")
-        
-    suggs = []
-    if sentiment < -0.2:
-        suggs.append("- Consider rest, hydration, talking to someone you trust, or a clinician if concerned.")
-        
-    return {"sentiment": sentiment, "tags": list(tags), "suggestions": suggs, "summary": text[:50]+"..."}
-
 def render_chips(entities_dict):
     chips_html = ""
     found = False
@@ -1126,51 +1039,42 @@ def render_chips(entities_dict):
 # -----------------------------------------------------------------------------
 def detect_red_flags(text):
     """Detects severe emergency terms in user text."""
-    text = text.lower()
-    red_flag_terms = ["chest pain", "trouble breathing", "difficulty breathing", "fainting", "pass out", 
-                      "severe allergic reaction", "confusion", "severe dehydration", "suicide", 
-                      "kill myself", "self-harm", "severe bleeding"]
-    return any(term in text for term in red_flag_terms)
-
-def build_assistant_context(notes, use_soap=True, use_diary=True):
-    context = ""
-    if use_soap:
-        soap_notes = [n for n in notes if isinstance(n, dict) and n.get("mode") == "soap"]
-        if soap_notes:
-            last = soap_notes[-1]
-            if isinstance(last, dict):
-                redacted = last.get('raw_text_redacted', '')
-                if not isinstance(redacted, str): redacted = str(redacted)
-                context += f"Last SOAP Note ({last.get('date', 'Unknown Date')}): {redacted[:100]}...\n"
-            
+    return bool(keywords.matcher("red_flags").matches(text))
+
+def build_assistant_context(use_soap=True, use_diary=True, query="", budget=retrieval.TOKEN_BUDGET):
+    """
+    Prompt context within ``budget`` tokens: recent trend figures, then the
+    freshest entries and those most relevant to ``query`` (see search.retrieval).
+    """
+    if not st.session_state.get("is_authenticated"):
+        return ""
+    return memoized(("context", use_soap, use_diary, query, budget),
+                    lambda: _assemble_context(use_soap, use_diary, query, budget))
+
+def _assemble_context(use_soap, use_diary, query, budget):
+    header = ""
     if use_diary:
-        diary_notes = [n for n in notes if isinstance(n, dict) and n.get("mode") == "diary"]
-        if diary_notes:
-            if isinstance(diary_notes, list):
-                recent_diary = diary_notes[-7:]
-                context += f"Last {len(recent_diary)} Diary Entries:\n"
-                for d in recent_diary:
-                    if isinstance(d, dict):
-                        redacted = d.get('raw_text_redacted', '')
-                        redacted_str = str(redacted)
-                        context += f"- {d.get('date', 'Unknown Date')}: {redacted_str[:50]}...\n"
-            
-            trends_data = analyze_trends(diary_notes)
+        trends_data = analyze_trends()
+        if trends_data:
             avg_mood = float(trends_data.get("sentiment_avg", 0.0))
-            top_syms_raw = trends_data.get("top_symptoms", [])
-            top_syms_list = []
-            if isinstance(top_syms_raw, list):
-                for s in top_syms_raw:
-                    if isinstance(s, (list, tuple)) and len(s) > 0:
-                        top_syms_list.append(str(s[0]))
-            
-            context += f"\nRecent Mood Avg: {avg_mood:.2f}\n"
-            context += f"Recent Top Symptoms: {', '.join(top_syms_list)}\n"
-            
+            top_syms_list = [str(s[0]) for s in trends_data.get("top_symptoms", [])
+                             if isinstance(s, (list, tuple)) and len(s) > 0]
+            header = f"Recent Mood Avg: {avg_mood:.2f}\n"
+            header += f"Recent Top Symptoms: {', '.join(top_syms_list)}\n"
+
+    lines, _ = retrieval.context_lines(
+        st.session_state["username"], query, use_soap=use_soap, use_diary=use_diary,
+        budget=budget - retrieval.estimate_tokens(header),
+    )
+    context = header
+    if lines:
+        context += "Relevant Entries:\n" + "\n".join(lines)
     return context.strip()
 
-def generate_chat_reply(user_message, context, history):
-    if detect_red_flags(user_message):
+def generate_chat_reply(user_message, context, history, red_flags=None):
+    if red_flags is None:
+        red_flags = detect_red_flags(user_message)
+    if red_flags:
         return "SAFETY ALERT: Seek urgent medical help immediately by calling local emergency services or going to the nearest emergency room. If you are a minor, please talk to a trusted adult right away."
     
     system_prompt = f"""You are a supportive AI Care Assistant. You provide informational support ONLY.
@@ -1236,35 +1140,17 @@ def generate_tts_audio(text):
         st.error(f"TTS Error: {e}")
         return None
 
-def update_streak(notes):
-    """Calculates login/entry streak and unlock progress from notes."""
-    if not notes:
+def update_streak():
+    """Calculates login/entry streak and unlock progress from the daily rollup."""
+    if not st.session_state.get("is_authenticated"):
+        return 0, 1, 3
+    daily = rollup_store.rollup(st.session_state["username"])
+    total_logs = daily.total
+    if not total_logs:
         return 0, 1, 3
     
-    dates = []
-    for n in notes:
-        try:
-            dates.append(datetime.strptime(n.get("date", "1970-01-01"), "%Y-%m-%d").date())
-        except:
-            pass
-            
-    dates = sorted(list(set(dates)), reverse=True)
-    
-    streak = 0
-    today = datetime.today().date()
-    yesterday = today - timedelta(days=1)
-    
-    if dates and (dates[0] == today or dates[0] == yesterday):
-        streak = 1
-        current_date = dates[0]
-        for d in dates[1:]:
-            if (current_date - d).days == 1:
-                streak += 1
-                current_date = d
-            elif (current_date - d).days > 1:
-                break
+    streak = daily.streak(datetime.today().date())
                 
-    total_logs = len(notes)
     level = (total_logs // 5) + 1
     next_unlock = 5 - (total_logs % 5)
     
@@ -1275,31 +1161,31 @@ def generate_insight(entry_text):
     messages.append({"role": "user", "content": entry_text})
     return generate_ai_response(messages, temp=0.5)
 
-def generate_weekly_summary(notes):
-    context = build_assistant_context(notes, use_soap=False, use_diary=True)
+def generate_weekly_summary():
+    context = build_assistant_context(use_soap=False, use_diary=True)
     system_prompt = f"Summarize the user's past 7 days based on the following logs. Keep it supportive, concise (under 50 words), and non-medical. NEVER diagnose. ALWAYS RESPOND IN THE SAME LANGUAGE AS THE USER. \n\nLogs:\n{context}"
     return generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.3)
 
-def generate_health_twin_summary(notes):
-    context = build_assistant_context(notes, use_soap=True, use_diary=True)
+def generate_health_twin_summary():
+    context = build_assistant_context(use_soap=True, use_diary=True)
     system_prompt = f"Analyze these logs and create a dynamic 'AI Health Twin Profile'. Summarize behavioral patterns, mood trends, and chronicity of symptoms. Keep it under 100 words, formatting with bullet points. NEVER diagnose. ALWAYS RESPOND IN THE SAME LANGUAGE AS THE USER. \n\nLogs:\n{context}"
     return generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.4)
 
-def generate_micro_habits(notes):
-    context = build_assistant_context(notes, use_soap=False, use_diary=True)
+def generate_micro_habits():
+    context = build_assistant_context(use_soap=False, use_diary=True)
     system_prompt = f"Based on the user's logs, suggest exactly 2 small, actionable 'Micro-Habits' they can do today to improve their specific documented challenges. Be very brief. ALWAYS RESPOND IN THE SAME LANGUAGE AS THE USER. \n\nLogs:\n{context}"
     response = generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.4)
     # Split by newlines or bullets to lists
     habits = [h.strip("- *").strip() for h in response.split("\n") if h.strip() and len(h) > 5]
     return habits[:2]
 
-def generate_question_prep(notes):
-    context = build_assistant_context(notes, use_soap=True, use_diary=True)
+def generate_question_prep():
+    context = build_assistant_context(use_soap=True, use_diary=True)
     system_prompt = f"Draft 3 specific questions the patient should ask their doctor during their next visit, based on their unresolved or persistent symptoms in these logs. \n\nLogs:\n{context}"
     return generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.3)
 
-def generate_care_circle_report(notes):
-    context = build_assistant_context(notes, use_soap=True, use_diary=True)
+def generate_care_circle_report():
+    context = build_assistant_context(use_soap=True, use_diary=True)
     system_prompt = f"Create a professional, structured 'Caregiver / Doctor Update Report' covering the last 7 days. Include: 1) Top Symptoms, 2) General Sentiment Trend, 3) Important Notes. Omit extreme emotional venting, focus on factual health trends. \n\nLogs:\n{context}"
     return generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.3)
 
@@ -1307,17 +1193,17 @@ def process_live_copilot(text):
     system_prompt = f"You are a clinical copilot listening to a doctor-patient consultation. Output two sections: 'Structured Notes' and 'Suggested Follow-up Questions for Patient'. Do NOT diagnose.\n\Transcript:\n{text}"
     return generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.2)
 
-def generate_monthly_report(notes):
-    context = build_assistant_context(notes, use_soap=False, use_diary=True)
+def generate_monthly_report():
+    context = build_assistant_context(use_soap=False, use_diary=True)
     system_prompt = f"Provide a brief, encouraging high-level summary of the user's month based on these logs. Identify any broad recurring themes. Keep it under 60 words. Strict rule: NO medical advice or diagnosis. \n\nLogs:\n{context}"
     return generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.3)
 
-def generate_doctor_prep(notes):
-    context = build_assistant_context(notes, use_soap=True, use_diary=True)
+def generate_doctor_prep():
+    context = build_assistant_context(use_soap=True, use_diary=True)
     system_prompt = f"Based on the following logs, prepare a short, bulleted list of 2-3 key points the user should discuss at their next doctor's appointment. Be informative, not diagnostic. \n\nLogs:\n{context}"
     return generate_ai_response([{"role": "system", "content": system_prompt}], temp=0.2)
 
-def generate_pdf_report(username, notes):
+def generate_pdf_report(username):
     """Generates a simple PDF report using fpdf."""
     try:
         from fpdf import FPDF
@@ -1337,21 +1223,38 @@ def generate_pdf_report(username, notes):
     pdf.cell(200, 10, txt="Summary Over Time", ln=True, align='L')
     pdf.set_font("Arial", size=12)
     
-    diary_notes = [n for n in notes if n.get("mode") == "diary"]
-    if diary_notes:
-        trends = analyze_trends(diary_notes)
+    trends = trend_store.trends(username)
+    if trends:
         avg_mood = trends.get("sentiment_avg", 0)
         pdf.multi_cell(0, 10, txt=f"Mood Trend: {get_mood_label(avg_mood)} (Avg Score: {avg_mood:.2f})")
         top_syms = trends.get("top_symptoms", [])
         sym_txt = ", ".join([f"{s[0]} ({s[1]})" for s in top_syms])
         pdf.multi_cell(0, 10, txt=f"Frequent Symptoms: {sym_txt if sym_txt else 'None reported'}")
     
+    month = rollup_store.days(username, since=datetime.today().date() - timedelta(days=30))
+    if month:
+        entries = sum(d.count for d in month)
+        moods = [d for d in month if d.sentiment_n]
+        pdf.multi_cell(0, 10, txt=f"Last 30 Days: {entries} entries on {len(month)} day(s)")
+        if moods:
+            low = min(d.sentiment_min for d in moods)
+            high = max(d.sentiment_max for d in moods)
+            pdf.multi_cell(0, 10, txt=f"Mood Range: {low:.2f} to {high:.2f}")
+    
+    cols = history_store.columns(username)
+    if len(cols):
+        rolling = history_store.rolling_sentiment(cols)
+        if not rolling.empty and not np.isnan(rolling["90d"].iloc[-1]):
+            pdf.multi_cell(0, 10, txt=f"90-Day Mood Average: {rolling['90d'].iloc[-1]:.2f}")
+        streaks = history_store.streak_history(cols)
+        pdf.multi_cell(0, 10, txt=f"Longest Logging Streak: {int(streaks['days'].max())} day(s)")
+    
     pdf.ln(5)
     pdf.set_font("Arial", 'B', 14)
     pdf.cell(200, 10, txt="Recent Timeline Highlights", ln=True, align='L')
     pdf.set_font("Arial", size=10)
     
-    for n in notes[-10:]:
+    for n in note_store.query_notes(username, limit=10):
         date = n.get("date", "N/A")
         raw = n.get("raw_text_redacted", "")[:80] + "..."
         pdf.multi_cell(0, 8, txt=f"[{date}] {raw}")
@@ -1371,43 +1274,44 @@ def render_privacy_badges():
         </div>
     """, unsafe_allow_html=True)
 
-def get_avatar_advice(user_message, context):
+def get_avatar_advice(user_message):
     """Unified function to get text and voice advice from OpenAI Assistant."""
     # 1. Generate text and voice advice
     with st.spinner("Avatar is synthesizing advice..."):
         # Add user message to persistent history
         st.session_state["messages"].append({"role": "user", "content": user_message})
         st.session_state["last_transcript"] = user_message
+        analysis = analyze_text(user_message)
         
         if st.session_state.get("active_flow") == "checkin":
             # Handle user response to check-in
             reply = ""
             
             # Save the entry
-            entities = extract_medical_concepts(user_message)
-            diary_data = process_diary_logic(user_message)
-            
             if not st.session_state.get("privacy_mode", False):
                 note_record = {
                     "timestamp": datetime.now().isoformat(),
                     "date": datetime.today().strftime("%Y-%m-%d"),
                     "mode": "diary",
-                    "raw_text_redacted": redact_phi(user_message),
-                    "medical_entities": entities,
-                    "diary": diary_data
+                    "raw_text_redacted": analysis.redacted,
+                    "medical_entities": analysis.entities,
+                    "diary": analysis.diary()
                 }
                 if "tags" not in note_record["diary"]: note_record["diary"]["tags"] = []
                 note_record["diary"]["tags"].append("Daily Check-in")
                 save_note(note_record)
                 
                 # Update streak and get stats
-                all_notes = load_notes()
-                streak, level, next_unlock = update_streak(all_notes)
+                streak, level, next_unlock = update_streak()
                 st.session_state["next_unlock_days"] = next_unlock
                 
                 # Generate reward response
                 insight = generate_insight(user_message)
                 reply = f"Saved  | Streak:  {streak} day(s) \n\n{insight}\n\n*Next unlock: Level {level + 1} in {next_unlock} more log(s).*"
+                
+                # The trend window already includes this entry, so alerts are current
+                for alert in generate_risk_alerts(analyze_trends()):
+                    reply += f"\n\n> {alert}"
             else:
                 reply = "Check-in complete (Privacy Mode Active - not saved)."
             
@@ -1416,22 +1320,22 @@ def get_avatar_advice(user_message, context):
         else:
             # Normal Q&A Flow
             # Get Text Reply
-            reply = generate_chat_reply(user_message, context, st.session_state["messages"])
+            # Retrieve context for this message rather than the generic recent history
+            context = build_assistant_context(True, True, query=user_message)
+            reply = generate_chat_reply(user_message, context, st.session_state["messages"],
+                                        red_flags=analysis.red_flags)
             
             # Auto-log to Analytics (Diary entry) if substantive
-            entities = extract_medical_concepts(user_message)
-            diary_data = process_diary_logic(user_message)
-            has_medical = any(len(v) > 0 for v in entities.values())
-            has_sentiment = abs(diary_data.get("sentiment", 0)) > 0.1
+            has_sentiment = abs(analysis.sentiment) > 0.1
             
-            if (has_medical or has_sentiment) and not st.session_state.get("privacy_mode", False):
+            if (analysis.has_medical or has_sentiment) and not st.session_state.get("privacy_mode", False):
                 note_record = {
                     "timestamp": datetime.now().isoformat(),
                     "date": datetime.today().strftime("%Y-%m-%d"),
                     "mode": "diary",
-                    "raw_text_redacted": redact_phi(user_message),
-                    "medical_entities": entities,
-                    "diary": diary_data
+                    "raw_text_redacted": analysis.redacted,
+                    "medical_entities": analysis.entities,
+                    "diary": analysis.diary()
                 }
                 if "tags" not in note_record["diary"]: note_record["diary"]["tags"] = []
                 if "Chat Insight" not in note_record["diary"]["tags"]:
@@ -1634,18 +1538,15 @@ if not st.session_state["is_authenticated"]:
                     elif password_input != password_confirm:
                         st.error("Passwords do not match.")
                     else:
-                        db = load_users_db()
                         safe_name = "".join([c for c in username_input if c.isalnum() or c == '_'])
-                        if safe_name in db:
+
+                        # Cheap lookup first so taken names don't pay for a hash;
+                        # the insert itself still refuses a concurrent registration.
+                        if get_user(safe_name) is not None:
+                            st.error("Username already exists.")
+                        elif not create_user(safe_name, auth.hash_password(password_input), datetime.now().isoformat()):
                             st.error("Username already exists.")
                         else:
-                            hashed = bcrypt.hashpw(password_input.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                            from datetime import datetime
-                            db[safe_name] = {
-                                "password_hash": hashed,
-                                "created_at": datetime.now().isoformat()
-                            }
-                            save_users_db(db)
                             user_data_dir(safe_name)
                             st.success(" Account created! Please login.")
             else:
@@ -1653,15 +1554,15 @@ if not st.session_state["is_authenticated"]:
                     if not username_input or not password_input:
                         st.error("Please enter credentials.")
                     else:
-                        db = load_users_db()
                         safe_name = "".join([c for c in username_input if c.isalnum() or c == '_'])
-                        if safe_name in db:
-                            stored_hash = db[safe_name]["password_hash"].encode('utf-8')
-                            if bcrypt.checkpw(password_input.encode('utf-8'), stored_hash):
+                        account = get_user(safe_name)
+                        if account is not None:
+                            if auth.check_password(password_input, account["password_hash"]):
                                 st.session_state["is_authenticated"] = True
                                 st.session_state["username"] = safe_name
                                 st.session_state["transcribed_text"] = ""
                                 st.session_state["messages"] = []
+                                st.session_state["saved_message_count"] = 0
                                 st.rerun()
                             else:
                                 st.error("Invalid credentials.")
@@ -1725,11 +1626,11 @@ def render_sidebar():
             st.session_state["is_authenticated"] = False
             st.session_state["username"] = None
             st.session_state["messages"] = []
+            st.session_state["saved_message_count"] = 0
             st.session_state["transcribed_text"] = ""
             st.rerun()
             
         st.divider()
-        all_notes = load_notes()
         
         # --- Chat Sessions Sidebar Section ---
         if current_page == "AI Doctor":
@@ -1738,13 +1639,13 @@ def render_sidebar():
                 import uuid
                 st.session_state["active_session_id"] = str(uuid.uuid4())
                 st.session_state["messages"] = []
+                st.session_state["saved_message_count"] = 0
                 st.session_state["last_transcript"] = ""
                 st.session_state["last_ai_reply"] = ""
                 st.rerun()
                 
-            chat_sessions = [n for n in all_notes if n.get("mode") == "chat_session"]
-            # Sort sessions by timestamp descending
-            chat_sessions = sorted(chat_sessions, key=lambda x: x.get("timestamp", ""), reverse=True)
+            # Index entries only; messages are loaded when a session is opened.
+            chat_sessions = session_store.list_sessions(st.session_state["username"])
             
             if not chat_sessions:
                 st.caption("No past conversations.")
@@ -1756,7 +1657,8 @@ def render_sidebar():
                     # We use a distinct key for each session button
                     if st.button(f"️ {safe_title}", key=f"session_{session.get('id')}", use_container_width=True, type=btn_type):
                         st.session_state["active_session_id"] = session.get("id")
-                        st.session_state["messages"] = session.get("messages", [])
+                        st.session_state["messages"] = session_store.load_messages(st.session_state["username"], session.get("id"))
+                        st.session_state["saved_message_count"] = len(st.session_state["messages"])
                         st.session_state["last_transcript"] = ""
                         st.session_state["last_ai_reply"] = ""
                         st.rerun()
@@ -1773,8 +1675,7 @@ def render_sidebar():
             st.success(" AI Engine Active")
             
         st.divider()
-        all_notes = load_notes()
-        streak, level, _ = update_streak(all_notes)
+        streak, level, _ = update_streak()
         st.markdown(f"**Health Level:** {level}")
         st.markdown(f"**Active Streak:**  {streak} Day(s)")
 
@@ -1782,9 +1683,10 @@ def render_overview_tab():
     # 3-Zone Layout Implementation (Sidebar is Zone 1 natively, col_main is Zone 2, col_context is Zone 3)
     col_main, col_context = st.columns([2.8, 1], gap="large")
     
-    all_notes = load_notes()
-    diary_notes = [n for n in all_notes if n.get("mode") == "diary"]
-    trends = analyze_trends(diary_notes)
+    recent_notes = query_notes(limit=3, newest_first=True)
+    total_notes = rollup_store.total_entries(st.session_state["username"])
+    diary_notes = query_notes(mode="diary", limit=1)
+    trends = analyze_trends()
     
     avg_mood = trends.get("sentiment_avg", 0)
     mood_label = get_mood_label(avg_mood)
@@ -1792,8 +1694,8 @@ def render_overview_tab():
     last_log_val = "None today"
     last_log_micro = "Daily log status"
     last_dt = None
-    if all_notes:
-        last_dt = datetime.fromisoformat(all_notes[-1].get("timestamp", datetime.now().isoformat()))
+    if recent_notes:
+        last_dt = datetime.fromisoformat(recent_notes[0].get("timestamp", datetime.now().isoformat()))
         if last_dt.date() == datetime.today().date():
             last_log_val = last_dt.strftime("%H:%M")
             last_log_micro = "Updated today"
@@ -1809,7 +1711,7 @@ def render_overview_tab():
         with s1: create_dashboard_card("Today's Mood", mood_label, "Sentiment", "blue")
         with s2: create_dashboard_card("Last Check-In", last_log_val, last_log_micro, "blue")
         with s3:
-            progress = (len(all_notes) % 5) * 20
+            progress = (total_notes % 5) * 20
             create_dashboard_card("Report Build", f"{progress}%", "To next summary", "blue")
         with s4: create_dashboard_card("Voice System", "Live", "AI Ready", "blue")
         
@@ -1840,7 +1742,7 @@ def render_overview_tab():
                     st.rerun()
         with q2:
             with st.container(border=True):
-                recent_update = last_log_val if all_notes else "No records"
+                recent_update = last_log_val if recent_notes else "No records"
                 st.markdown(f'<div style="font-size:2rem; text-align:center;"></div><div style="font-weight:bold; text-align:center; margin-bottom:0.5rem; color:#1e293b;">Health Records</div><div style="font-size:0.75rem; color:#64748b; text-align:center; min-height: 2.5rem;">Last update: {recent_update}</div>', unsafe_allow_html=True)
                 if st.button("View Records", key="qa_rec_2", use_container_width=True):
                     st.session_state["current_page"] = "Reports"
@@ -1874,8 +1776,8 @@ def render_overview_tab():
         with ca2:
             with st.container(border=True):
                 st.markdown('<div style="font-weight:600; font-size:0.9rem; margin-bottom:0.5rem; color:#1e293b;">Recent Logs</div>', unsafe_allow_html=True)
-                if all_notes:
-                    for n in all_notes[-3:][::-1]:
+                if recent_notes:
+                    for n in recent_notes:
                         dt = n.get("date", "Unknown")
                         raw_text = n.get("raw_text_redacted", "")
                         clean_text = clean_html(raw_text)
@@ -2049,23 +1951,22 @@ def render_find_care():
 def render_insights_page():
     st.markdown('<div class="section-header">Health Insights & Analysis</div>', unsafe_allow_html=True)
     
-    all_notes = load_notes()
-    diary_notes = [n for n in all_notes if n.get("mode") == "diary"]
+    # Latest 14 days with a diary entry, one point per day
+    diary_days = rollup_store.rollup(st.session_state["username"]).last(14, mode="diary")
     
-    if not diary_notes:
+    if not diary_days:
         render_empty_state("Log your daily check-ins to unlock behavioral and health twin insights.", icon="", cta={"label": "Start Daily Check-In", "action": lambda: st.session_state.update({"current_page": "Daily Check-In"})})
     else:
         # Dashboard style analytics
-        trends = analyze_trends(diary_notes)
+        trends = analyze_trends()
         
         i1, i2 = st.columns([1, 1])
         with i1:
             with st.container(border=True):
                 st.markdown("#### Sentiment Arc (Mood Trend)")
                 try:
-                    graph_notes = diary_notes[-14:]
-                    dates = [str(n.get("date", "Unknown")) for n in graph_notes]
-                    scores = [float(n.get("diary", {}).get("sentiment", 0.0)) for n in graph_notes]
+                    dates = [d.date for d in diary_days]
+                    scores = [d.sentiment_mean or 0.0 for d in diary_days]
                     fig, ax = plt.subplots(figsize=(6, 3))
                     ax.plot(dates, scores, marker='o', color='#3A86FF')
                     ax.axhline(0, color='gray', linestyle='--')
@@ -2084,16 +1985,54 @@ def render_insights_page():
             with st.container(border=True):
                 st.markdown("#### AI Health Twin Profile")
                 if st.button("Regenerate Twin Profile"):
-                    st.session_state["health_twin_summary"] = generate_health_twin_summary(all_notes)
+                    st.session_state["health_twin_summary"] = generate_health_twin_summary()
                 st.write(st.session_state.get("health_twin_summary", "Profile pending regeneration."))
                 
             with st.container(border=True):
                 st.markdown("#### Micro-Habit Prescriptions")
                 if st.button("Generate Today's Habits"):
-                    st.session_state["habits"] = generate_micro_habits(all_notes)
+                    st.session_state["habits"] = generate_micro_habits()
                 if st.session_state.get("habits"):
                     for hb in st.session_state["habits"]: st.checkbox(hb)
 
+        render_long_term_trends()
+
+def render_long_term_trends():
+    """Whole-history views computed on the cached columnar arrays (see analytics.history)."""
+    cols = history_store.columns(st.session_state["username"])
+    if len(cols) < 2:
+        return
+    st.markdown("#### Long-Term Trends")
+    l1, l2 = st.columns([2, 1])
+    with l1:
+        with st.container(border=True):
+            st.markdown("**Rolling Mood (7 / 30 / 90 days)**")
+            rolling = history_store.rolling_sentiment(cols)
+            if not rolling.empty:
+                st.line_chart(rolling.iloc[-365:], height=220)
+    with l2:
+        with st.container(border=True):
+            st.markdown("**Mood by Day of Week**")
+            st.bar_chart(history_store.weekday_effects(cols)["mean_sentiment"], height=220)
+    l3, l4 = st.columns([2, 1])
+    with l3:
+        with st.container(border=True):
+            st.markdown("**Weekly Symptom Frequency (last 12 weeks)**")
+            weekly = history_store.weekly_symptoms(cols, top=6, weeks=12)
+            if weekly.empty:
+                st.caption("No symptoms recorded yet.")
+            else:
+                st.bar_chart(weekly, height=220)
+    with l4:
+        with st.container(border=True):
+            st.markdown("**Streak History**")
+            streaks = history_store.streak_history(cols, min_length=2)
+            if streaks.empty:
+                st.caption("No multi-day streaks yet.")
+            else:
+                st.metric("Longest Streak", f"{int(streaks['days'].max())} days")
+                st.dataframe(streaks.iloc[::-1].head(5), hide_index=True, use_container_width=True)
+
 def render_dashboard():
     tab1, tab2, tab3 = st.tabs(["Overview", "Reports", "Insights"])
     with tab1:
@@ -2106,7 +2045,7 @@ def render_dashboard():
 def render_reports_page():
     st.markdown('<div class="section-header">Health Reports & Records</div>', unsafe_allow_html=True)
     
-    notes = load_notes()
+    notes = query_notes(newest_first=True)
     if not notes:
         render_empty_state("No records found. Complete a daily check-in to start building your timeline.", icon="", cta={"label": "Record First Entry", "action": lambda: st.session_state.update({"current_page": "Daily Check-In"})})
         return
@@ -2118,7 +2057,7 @@ def render_reports_page():
         
         if st.button("Generate Monthly Report PDF", type="primary"):
             with st.spinner("Preparing clinical summary..."):
-                pdf_bytes = generate_pdf_report(st.session_state["username"], notes)
+                pdf_bytes = generate_pdf_report(st.session_state["username"])
                 if pdf_bytes:
                     st.download_button(
                         label="Download Report (PDF)",
@@ -2129,9 +2068,59 @@ def render_reports_page():
                 else:
                     st.error("Error generating PDF. Please ensure all dependencies are met.")
     
+    # Search
+    with st.container(border=True):
+        st.markdown("###  Search Your Records")
+        col_q, col_from, col_to = st.columns([2, 1, 1])
+        with col_q:
+            search_query = st.text_input("Search", placeholder="e.g. headache after work", key="reports_search_query")
+        with col_from:
+            search_since = st.date_input("From", value=None, key="reports_search_since")
+        with col_to:
+            search_until = st.date_input("To", value=None, key="reports_search_until")
+
+        search_key = (search_query, search_since, search_until)
+        if st.session_state.get("reports_search_key") != search_key:
+            st.session_state["reports_search_key"] = search_key
+            st.session_state["reports_search_page"] = 0
+
+        if search_query.strip():
+            page_size = 10
+            page = st.session_state.get("reports_search_page", 0)
+            hits, total = search_store.search(
+                st.session_state["username"], search_query,
+                since=search_since, until=search_until,
+                offset=page * page_size, limit=page_size,
+            )
+            if not total:
+                st.info("No records match your search.")
+            else:
+                first = page * page_size + 1
+                st.caption(f"Showing {first}-{first + len(hits) - 1} of {total} matching records")
+                for score, n in hits:
+                    st.markdown(f"""
+                    <div style="background: #ffffff; padding: 1rem; border-radius: 8px; border: 1px solid #e2e8f0; margin-bottom: 1rem;">
+                        <div style="display: flex; justify-content: space-between;">
+                            <b>{n.get('mode', 'Note').upper()}</b>
+                            <span style="font-size: 0.8rem; color: #64748b;">{n.get('date')} · relevance {score:.2f}</span>
+                        </div>
+                        <div style="margin-top: 5px; font-size: 0.95rem;">{clean_html(n.get('raw_text_redacted', ''))[:400]}</div>
+                    </div>
+                    """, unsafe_allow_html=True)
+                col_prev, _, col_next = st.columns([1, 3, 1])
+                with col_prev:
+                    if page > 0 and st.button("← Previous", key="reports_search_prev"):
+                        st.session_state["reports_search_page"] = page - 1
+                        st.rerun()
+                with col_next:
+                    if first + len(hits) - 1 < total and st.button("Next →", key="reports_search_next"):
+                        st.session_state["reports_search_page"] = page + 1
+                        st.rerun()
+            return
+
     # Existing Records Timeline
     with st.expander("View Full Medical Timeline", expanded=True):
-        for n in reversed(notes):
+        for n in notes:
             mode_icon = "" if n.get("mode") == "soap" else ""
             bg = "#f8fafc" if n.get("mode") == "soap" else "#ffffff"
             st.markdown(f"""
@@ -2185,20 +2174,13 @@ elif current_page == "AI Doctor":
         st.markdown("<br>", unsafe_allow_html=True)
         st.markdown('<div style="font-weight: 600; color: #475569; margin-bottom: 0.5rem; font-size: 0.85rem; text-transform: uppercase;">Quick Actions</div>', unsafe_allow_html=True)
         if st.button("Spot Weekly Patterns", use_container_width=True):
-            notes = load_notes()
-            context = build_assistant_context(notes, True, True)
-            get_avatar_advice("Can you spot any patterns in my logs this week?", context)
+            get_avatar_advice("Can you spot any patterns in my logs this week?")
             st.rerun()
         if st.button("Appt Prep Highlights", use_container_width=True):
-            notes = load_notes()
-            context = build_assistant_context(notes, True, True)
-            get_avatar_advice("Summarize the most important points for my next doctor visit.", context)
+            get_avatar_advice("Summarize the most important points for my next doctor visit.")
             st.rerun()
 
     with col_interaction:
-        notes = load_notes()
-        context = build_assistant_context(notes, True, True)
-        
         # Modern Chat History Display
         st.markdown('<div style="font-weight: 600; color: #475569; margin-bottom: 0.5rem; font-size: 0.85rem; text-transform: uppercase;">Active Consultation</div>', unsafe_allow_html=True)
         
@@ -2231,7 +2213,7 @@ elif current_page == "AI Doctor":
                     with st.spinner("Analyzing speech..."):
                         voice_text = transcribe_audio_bytes(audio_bytes)
                         if voice_text and not voice_text.startswith("[Error"):
-                            get_avatar_advice(voice_text, context)
+                            get_avatar_advice(voice_text)
                             st.rerun()
                         elif not voice_text:
                             st.warning("No speech detected.")
@@ -2241,7 +2223,7 @@ elif current_page == "AI Doctor":
         # Text Input fallback integrated seamlessly
         txt_input = st.chat_input("Type your message here...")
         if txt_input:
-            get_avatar_advice(txt_input, context)
+            get_avatar_advice(txt_input)
             st.rerun()
 
         # Handle Audio Playback animations if a new message was generated
@@ -2261,7 +2243,7 @@ elif current_page == "AI Doctor":
                 st.rerun()
 
         if st.button("Doctor Questions", use_container_width=True):
-            get_avatar_advice("Generate Questions", context)
+            get_avatar_advice("Generate Questions")
 
 elif current_page == "Daily Check-In":
     st.markdown('<div class="section-header" style="border-left-color: #16a34a;">Daily Health Check-In</div>', unsafe_allow_html=True)
@@ -2306,12 +2288,11 @@ elif current_page == "Daily Check-In":
             st.markdown('</div>', unsafe_allow_html=True)
             
             # Mini Trend Preview
-            all_notes = load_notes()
-            diary_notes = [n for n in all_notes if n.get("mode") == "diary"]
-            if len(diary_notes) > 1:
+            diary_days = rollup_store.rollup(st.session_state["username"]).last(7, mode="diary")
+            if len(diary_days) > 1:
                 st.markdown('<div class="card" style="padding: 1rem; border-top: 4px solid #8b5cf6;">', unsafe_allow_html=True)
                 st.markdown('<h4 style="color: #5b21b6; font-size: 0.9rem; margin-top:0;">7-Day Trend</h4>', unsafe_allow_html=True)
-                scores = [float(n.get("diary", {}).get("sentiment", 0)) for n in diary_notes[-7:]]
+                scores = [d.sentiment_mean or 0.0 for d in diary_days]
                 st.line_chart(scores, height=120)
                 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -2378,20 +2359,22 @@ elif current_page == "Daily Check-In":
             if input_text.strip():
                 with st.spinner("Analyzing and securing your clinical note..."):
                     today_str = datetime.today().strftime("%Y-%m-%d")
-                    redacted_text = redact_phi(input_text)
+                    is_soap = "SOAP" in checkin_mode
+                    analysis = analyze_text(input_text, stages=("ner",) if is_soap else pipeline.STAGES)
+                    redacted_text = analysis.redacted
                     
                     note_record = {
                         "timestamp": datetime.now().isoformat(),
                         "date": today_str,
-                        "mode": "soap" if "SOAP" in checkin_mode else "diary",
+                        "mode": "soap" if is_soap else "diary",
                         "raw_text_redacted": redacted_text,
-                        "medical_entities": extract_medical_concepts(redacted_text)
+                        "medical_entities": analysis.entities
                     }
                     
                     if note_record["mode"] == "soap":
                         note_record["soap"] = {"text": process_soap(redacted_text)}
                     else:
-                        note_record["diary"] = process_diary_logic(redacted_text)
+                        note_record["diary"] = analysis.diary()
                     
                     save_note(note_record)
                     st.session_state["transcribed_text"] = ""
@@ -2434,9 +2417,7 @@ elif current_page == "Settings":
             st.rerun()
             
     st.markdown('<div class="section-header" style="margin-top: 2rem;">Secure Chat History</div>', unsafe_allow_html=True)
-    all_notes = load_notes()
-    chat_sessions = [n for n in all_notes if n.get("mode") == "chat_session"]
-    chat_sessions = sorted(chat_sessions, key=lambda x: x.get("timestamp", ""), reverse=True)
+    chat_sessions = session_store.list_sessions(st.session_state["username"])
     
     with st.container(border=True):
         if not chat_sessions:
@@ -2448,10 +2429,17 @@ elif current_page == "Settings":
                 date_str = session.get("date", "Unknown Date")
                 
                 with st.expander(f"️ {date_str} — {safe_title}"):
-                    messages = session.get("messages", [])
-                    if not messages:
+                    if not session.get("count"):
                         st.write("*No messages recorded.*")
                         continue
+                    # Expander bodies run on every rerun, so only the
+                    # transcript the user asked for is read from storage.
+                    if st.session_state.get("history_session_id") != session.get("id"):
+                        if st.button(f"Show {session['count']} messages", key=f"history_{session.get('id')}"):
+                            st.session_state["history_session_id"] = session.get("id")
+                            st.rerun()
+                        continue
+                    messages = session_store.load_messages(st.session_state["username"], session.get("id"))
                         
                     for msg in messages:
                         is_user = msg["role"] == "user"
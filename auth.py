@@ -0,0 +1,40 @@
+"""
+Password hashing and verification on a bounded worker pool.
+
+bcrypt is slow on purpose. Running it on a small shared pool caps how much
+CPU a burst of logins or registrations can take from other sessions' reruns;
+extra requests wait in the pool's queue. bcrypt releases the GIL while it
+works, so the calling script thread only blocks on its own result.
+
+``BCRYPT_ROUNDS`` sets the cost factor for new hashes (existing hashes keep
+the cost they were created with); ``BCRYPT_WORKERS`` sizes the pool.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+
+_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def _check(password, password_hash):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+    except ValueError:
+        # Malformed stored hash.
+        return False
+
+
+def hash_password(password):
+    return _pool.submit(_hash, password).result()
+
+
+def check_password(password, password_hash):
+    return _pool.submit(_check, password, password_hash).result()
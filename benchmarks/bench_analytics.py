@@ -0,0 +1,67 @@
+"""
+Benchmark of analytics.history on a synthetic 10-year history.
+
+    python -m benchmarks.bench_analytics [--years 10] [--per-day 3]
+
+Times the one-off columnar extraction, appending one note (what a save
+costs), and each vectorized view the Insights page renders.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from analytics import history
+
+SYMPTOMS = ["headache", "cough", "fever", "fatigue", "nausea", "dizziness", "back pain",
+            "insomnia", "sore throat", "rash", "anxiety", "chest tightness"]
+
+
+def synthetic_notes(years, per_day, seed=7):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365 * years)
+    notes = []
+    for day in range(365 * years):
+        d = (start + timedelta(days=day)).isoformat()
+        for i in range(rng.randint(0, 2 * per_day)):
+            notes.append({
+                "id": f"{day}-{i}",
+                "date": d,
+                "timestamp": f"{d}T{8 + i:02d}:00:00",
+                "mode": "diary" if rng.random() < 0.8 else "soap",
+                "diary": {"sentiment": rng.uniform(-1, 1)},
+                "medical_entities": {"symptoms": rng.sample(SYMPTOMS, rng.randint(0, 3))},
+            })
+    return notes
+
+
+def timed(label, fn, repeat=20):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    ms = (time.perf_counter() - t0) * 1000 / repeat
+    print(f"{label:<32} {ms:8.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--per-day", type=int, default=3)
+    args = parser.parse_args()
+
+    notes = synthetic_notes(args.years, args.per_day)
+    print(f"{len(notes)} notes over {args.years} years")
+
+    cols = timed("extract columns (once/version)", lambda: history.Columns.from_notes(notes), repeat=3)
+    extra = [dict(notes[-1], id="new")]
+    timed("append one note (per save)", lambda: cols.extended(extra))
+    timed("rolling 7/30/90-day sentiment", lambda: history.rolling_sentiment(cols))
+    timed("day-of-week effects", lambda: history.weekday_effects(cols))
+    timed("weekly symptom frequency", lambda: history.weekly_symptoms(cols, top=8))
+    timed("streak history", lambda: history.streak_history(cols))
+
+
+if __name__ == "__main__":
+    main()
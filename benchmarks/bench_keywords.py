@@ -0,0 +1,82 @@
+"""
+Benchmark of nlp.keywords against the per-keyword loops it replaced.
+
+    python -m benchmarks.bench_keywords [--texts 2000] [--extra-terms 3000]
+
+For every rule set, times ``any(term in text for term in terms)`` per
+category (the old loops) and the compiled matcher, first with the shipped
+rules and then with each rule set grown by ``--extra-terms`` synthetic terms.
+"""
+import argparse
+import random
+import string
+import time
+
+from nlp import keywords
+
+WORDS = ("today i felt tired after work and my head was hurting a bit so i rested "
+         "slept badly again woke up at night with a dry throat and some coughing "
+         "walked in the park ate lunch with friends stressed about the exam "
+         "knee pain after running took ibuprofen 200 mg blood pressure seemed fine").split()
+
+
+def synthetic_texts(count, seed=5):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 80))) for _ in range(count)]
+
+
+def grown(rules, extra, seed=9):
+    rng = random.Random(seed)
+    out = {}
+    for name, rule_set in rules.items():
+        out[name] = {}
+        for i, (category, terms) in enumerate(rule_set.items()):
+            share = extra // len(rule_set) + (1 if i < extra % len(rule_set) else 0)
+            fake = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 14)))
+                    for _ in range(share)]
+            out[name][category] = list(terms) + fake
+    return out
+
+
+def loops(rule_set, text):
+    text = text.lower()
+    return [c for c, terms in rule_set.items() if any(t in text for t in terms)]
+
+
+def timed(label, fn, texts):
+    t0 = time.perf_counter()
+    for text in texts:
+        fn(text)
+    us = (time.perf_counter() - t0) * 1e6 / len(texts)
+    print(f"  {label:<28} {us:9.1f} us/text")
+    return us
+
+
+def run(rules, texts):
+    for name, rule_set in rules.items():
+        m = keywords.KeywordMatcher(rule_set)
+        for text in texts[:200]:
+            assert m.matches(text) == loops(rule_set, text), (name, text)
+        terms = sum(len(t) for t in rule_set.values())
+        print(f"{name} ({terms} terms)")
+        old = timed("per-keyword loops", lambda t: loops(rule_set, t), texts)
+        new = timed("compiled matcher", m.matches, texts)
+        print(f"  {'speed-up':<28} {old / new:9.1f} x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--extra-terms", type=int, default=3000)
+    args = parser.parse_args()
+
+    rules = keywords.load_rules()
+    texts = synthetic_texts(args.texts)
+    print(f"{len(texts)} texts, shipped rules")
+    run(rules, texts)
+    print(f"\n{len(texts)} texts, {args.extra_terms} extra terms per rule set")
+    run(grown(rules, args.extra_terms), texts)
+
+
+if __name__ == "__main__":
+    main()
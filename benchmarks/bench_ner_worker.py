@@ -0,0 +1,90 @@
+"""
+Benchmark of the shared NER worker against in-process extraction.
+
+    python -m benchmarks.bench_ner_worker [--threads 8] [--requests 200] [--replicas 4]
+
+Starts nlp.ner_worker on a temporary socket and sends ``--requests`` single
+texts from each of ``--threads`` threads (concurrent chats), then does the
+same through an in-process model. Also reports the resident memory the
+model costs in one process, and what ``--replicas`` app processes on a host
+would hold with and without the worker. Without spaCy or the model both
+sides use the keyword rules only, which measures the socket overhead alone.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from nlp import ner, ner_worker
+from benchmarks.bench_keywords import synthetic_texts
+
+
+def rss_mb(pid="self"):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def concurrent(label, extract, texts, threads):
+    per_thread = [texts[i::threads] for i in range(threads)]
+
+    def work(chunk):
+        for text in chunk:
+            extract(text)
+
+    workers = [threading.Thread(target=work, args=(chunk,)) for chunk in per_thread]
+    t0 = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    seconds = time.perf_counter() - t0
+    print(f"  {label:<24} {len(texts) / seconds:9.0f} texts/sec  "
+          f"({seconds * 1000 / len(texts) * threads:.2f} ms per request)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per thread")
+    parser.add_argument("--replicas", type=int, default=4, help="app processes per host")
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.threads * args.requests)
+    path = os.path.join(tempfile.mkdtemp(), "ner.sock")
+    worker = subprocess.Popen([sys.executable, "-m", "nlp.ner_worker", "--socket", path])
+    try:
+        client = ner_worker.Client(path)
+        deadline = time.monotonic() + 300
+        while True:
+            try:
+                version = client.version()
+                break
+            except ner_worker.WorkerUnavailable:
+                if worker.poll() is not None or time.monotonic() > deadline:
+                    raise SystemExit("The NER worker did not start.")
+                time.sleep(0.2)
+        print(f"{len(texts)} requests from {args.threads} threads; extractor {version}")
+        concurrent("shared worker", client.extract, texts, args.threads)
+        worker_mb = rss_mb(worker.pid)
+    finally:
+        worker.terminate()
+        worker.wait()
+
+    before = rss_mb()
+    nlp = ner.load_model()
+    model_mb = rss_mb() - before
+    concurrent("in-process model", lambda text: ner.extract(text, nlp), texts, args.threads)
+
+    print(f"\nModel in one process: +{model_mb:.0f} MB; worker process: {worker_mb:.0f} MB")
+    print(f"{args.replicas} replicas: {args.replicas * model_mb:.0f} MB of models in-process, "
+          f"{worker_mb:.0f} MB with one shared worker")
+
+
+if __name__ == "__main__":
+    main()
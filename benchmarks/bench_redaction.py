@@ -0,0 +1,113 @@
+"""
+Benchmark of nlp.redaction on a large document.
+
+    python -m benchmarks.bench_redaction [--mb 1] [--chunk-kb 64] [--token-kb 50] [--min-mb-per-sec 0]
+
+Builds a synthetic clinical document of ``--mb`` megabytes sprinkled with
+PHI, then times the four sequential ``re.sub`` passes redaction used to
+make, the combined scan with the same (core) rules, the combined scan with
+every shipped pack, and streaming in ``--chunk-kb`` chunks, checking that
+streaming gives the same text and counts as the whole-text scan. Also
+times a single ``--token-kb`` token with no spaces (a pasted blob) and
+twice that, and exits non-zero if doubling the length more than triples
+the time: a rule whose start is not anchored goes quadratic there. With
+``--min-mb-per-sec`` it also exits non-zero when the all-packs scan is
+slower, so the figure can be tracked in CI.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from nlp import redaction
+
+PROSE = ("patient reports mild headache since monday and slept poorly. "
+         "Blood pressure 128/82 at the visit, advised hydration and rest. "
+         "Follow up in two weeks if the cough persists. ").split(" ")
+PHI = ("jane.doe@example.com", "(555) 123-4567", "555.987.6543", "DOB: 1984-03-12",
+       "Patient Name: John Smith", "SSN 123-45-6789", "MRN: A12345678",
+       "lives at 42 Maple Grove Lane", "Springfield, IL 62704")
+
+_OLD = ((re.compile(r'[\w\.-]+@[\w\.-]+\.\w+'), '[REDACTED_EMAIL]'),
+        (re.compile(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'), '[REDACTED_PHONE]'),
+        (re.compile(r'(?i)(dob|date of birth|birthdate)[\s:]*\d{1,4}[-/]\d{1,2}[-/]\d{1,4}'),
+         r'\1: [REDACTED_DOB]'),
+        (re.compile(r'(?i)(patient name|name)[\s:]+([A-Z][a-z]+ [A-Z][a-z]+)'),
+         r'\1: [REDACTED_NAME]'))
+
+
+def sequential(text):
+    for pattern, replacement in _OLD:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def synthetic_document(mb, seed=3):
+    rng = random.Random(seed)
+    words, size = [], 0
+    while size < mb * 1_000_000:
+        word = rng.choice(PHI) if rng.random() < 0.01 else rng.choice(PROSE)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+def chunked(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+def timed(label, fn, text):
+    t0 = time.perf_counter()
+    out = fn()
+    seconds = time.perf_counter() - t0
+    mb_per_sec = len(text) / 1e6 / seconds
+    print(f"  {label:<34} {seconds * 1000:8.1f} ms  {mb_per_sec:7.1f} MB/s")
+    return out, mb_per_sec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=float, default=1.0)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    parser.add_argument("--token-kb", type=int, default=50)
+    parser.add_argument("--min-mb-per-sec", type=float, default=0.0)
+    args = parser.parse_args()
+
+    text = synthetic_document(args.mb)
+    core = redaction.engine(("core",))
+    packs = tuple(redaction.load_packs())
+    all_packs = redaction.engine(packs)
+    print(f"{len(text) / 1e6:.2f} MB document, packs: {', '.join(packs)}")
+
+    old, _ = timed("sequential re.sub (core rules)", lambda: sequential(text), text)
+    new, _ = timed("combined scan (core rules)", lambda: core.redact(text), text)
+    if new != old:
+        print("  note: combined and sequential core output differ (overlapping matches)")
+    counts = {}
+    whole, mb_per_sec = timed("combined scan (all packs)", lambda: all_packs.redact(text, counts), text)
+    streamed_counts = {}
+    streamed, _ = timed(f"streaming, {args.chunk_kb} KB chunks",
+                        lambda: "".join(all_packs.stream(chunked(text, args.chunk_kb * 1024),
+                                                       streamed_counts)), text)
+    assert streamed == whole and streamed_counts == counts, "streaming differs from whole-text scan"
+    for size in (1, 7, 300, 4096):
+        assert "".join(all_packs.stream(chunked(text[:200_000], size))) == all_packs.redact(text[:200_000])
+
+    print("  matches: " + ", ".join(f"{name} {counts.get(name, 0)}" for name in all_packs.names))
+
+    seconds = []
+    for size in (args.token_kb * 1000, args.token_kb * 2000):
+        token = "a" * size
+        t0 = time.perf_counter()
+        all_packs.redact(token)
+        seconds.append(time.perf_counter() - t0)
+        print(f"  {f'single {size // 1000} KB token':<34} {seconds[-1] * 1000:8.1f} ms")
+    if seconds[1] > 3 * seconds[0] and seconds[1] > 0.05:
+        sys.exit("Redaction time grows faster than the length of a single long token.")
+    if mb_per_sec < args.min_mb_per_sec:
+        sys.exit(f"Redaction throughput {mb_per_sec:.1f} MB/s is below {args.min_mb_per_sec} MB/s.")
+
+
+if __name__ == "__main__":
+    main()
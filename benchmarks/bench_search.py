@@ -0,0 +1,75 @@
+"""
+Benchmark of search.fulltext (BM25) on a synthetic history.
+
+    python -m benchmarks.bench_search [--notes 30000]
+
+Times building the index once, extending it by one note (what a save
+costs) and a few typical queries, with and without a date filter.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from search.fulltext import FullTextIndex
+
+WORDS = ("today i felt tired after work and my head was hurting a bit so i rested "
+         "slept badly again woke up at night with a dry throat and some coughing "
+         "walked in the park ate lunch with friends stressed about the exam "
+         "knee pain after running took ibuprofen blood pressure seemed fine").split()
+SYMPTOMS = ["headache", "cough", "fever", "fatigue", "nausea", "dizziness", "back pain",
+            "insomnia", "sore throat", "rash", "anxiety", "chest tightness"]
+QUERIES = ["dizziness", "headache after work", "knee pain running", "slept badly night cough"]
+
+
+def synthetic_notes(count, seed=11):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=count // 3)
+    notes = []
+    for i in range(count):
+        symptoms = rng.sample(SYMPTOMS, rng.randint(0, 2))
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 60)))
+        notes.append({
+            "id": str(i),
+            "date": (start + timedelta(days=i // 3)).isoformat(),
+            "mode": "diary" if rng.random() < 0.8 else "soap",
+            "raw_text_redacted": f"{text} {' '.join(symptoms)}",
+            "diary": {"tags": ["Daily Check-in"]},
+            "medical_entities": {"symptoms": symptoms},
+        })
+    return notes
+
+
+def timed(label, fn, repeat=20):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    print(f"{label:<44} {(time.perf_counter() - t0) * 1000 / repeat:8.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=30000)
+    args = parser.parse_args()
+
+    notes = synthetic_notes(args.notes)
+    print(f"{len(notes)} notes")
+    index = timed("build index (once/version)", lambda: FullTextIndex().added(notes), repeat=1)
+    extra = [dict(notes[-1], id="new")]
+    timed("add one note (per save)", lambda: index.added(extra))
+    grown = index
+    t0 = time.perf_counter()
+    for i in range(1000):
+        grown = grown.added([dict(notes[i], id=f"extra-{i}")])
+    print(f"{'add 1000 notes one save at a time':<44} {(time.perf_counter() - t0):8.2f} s"
+          f" ({len(grown.segments)} segments)")
+    since = (date.today() - timedelta(days=90)).isoformat()
+    for query in QUERIES:
+        timed(f"query {query!r}", lambda: index.search(query, top=10))
+        timed(f"query {query!r}, last 90 days", lambda: index.search(query, since=since, top=10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of nlp.sentiment against building a VADER analyzer per call.
+
+    python -m benchmarks.bench_sentiment [--texts 2000]
+
+Times the old per-call ``SentimentIntensityAnalyzer().polarity_scores``,
+``sentiment.score`` with the shared analyzer, and ``score_batch`` over the
+same texts (with some repeats, as in a backfill), then compares whole-text
+and sentence-level scores of a long dictation.
+"""
+import argparse
+import random
+import time
+
+from nlp import sentiment
+
+SENTENCES = ("I slept badly again and woke up with a headache.",
+             "Work was stressful but lunch with friends helped a lot.",
+             "Knee pain after running, took ibuprofen and rested.",
+             "Feeling much better today, went for a walk in the park.",
+             "Anxious about the exam tomorrow.",
+             "Blood pressure seemed fine this morning.",
+             "Really happy with how physio is going!",
+             "Coughing at night, throat is dry and sore.")
+
+
+def synthetic_texts(count, seed=7):
+    rng = random.Random(seed)
+    unique = [" ".join(rng.sample(SENTENCES, rng.randint(1, 4))) for _ in range(count * 3 // 4)]
+    return unique + rng.sample(unique, count - len(unique))
+
+
+def timed(label, fn, calls):
+    t0 = time.perf_counter()
+    fn()
+    us = (time.perf_counter() - t0) * 1e6 / calls
+    print(f"  {label:<32} {us:9.1f} us/text")
+    return us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=2000)
+    args = parser.parse_args()
+
+    if not sentiment.HAS_VADER:
+        raise SystemExit("vaderSentiment is not installed.")
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+    texts = synthetic_texts(args.texts)
+    old_sample = texts[:max(1, len(texts) // 20)]  # the old path is slow; time a slice
+    print(f"{len(texts)} texts")
+    old = timed("analyzer per call (old)",
+                lambda: [SentimentIntensityAnalyzer().polarity_scores(t) for t in old_sample],
+                len(old_sample))
+    sentiment.analyzer()  # built once, outside the timings below
+    new = timed("sentiment.score", lambda: [sentiment.score(t) for t in texts], len(texts))
+    batch = timed("sentiment.score_batch", lambda: sentiment.score_batch(texts), len(texts))
+    print(f"  {'speed-up (score)':<32} {old / new:9.1f} x")
+    print(f"  {'speed-up (score_batch)':<32} {old / batch:9.1f} x")
+
+    dictation = " ".join(SENTENCES * 2)
+    print(f"\nLong dictation ({len(dictation)} chars, {len(sentiment.sentences(dictation))} sentences)")
+    print(f"  whole-text compound (score)           {sentiment.score(dictation):+.3f}")
+    print(f"  sentence mean (score_by_sentence)     {sentiment.score_by_sentence(dictation):+.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import sys
 
 DB_PATH = os.path.join("data", "health_assistant.db")
 
@@ -27,5 +28,15 @@ def migrate():
     finally:
         conn.close()
 
+def import_json():
+    """One-shot import of the JSON accounts, notes and chat sessions under data/ into SQLite."""
+    from storage.sqlite_backend import import_json_store
+    imported = import_json_store()
+    for username, count in imported.items():
+        print(f"Imported {count} notes for '{username}'.")
+    print(f"Import complete ({len(imported)} users). Set STORAGE_BACKEND=sqlite to use it.")
+
 if __name__ == "__main__":
+    if "--import-json" in sys.argv:
+        import_json()
     migrate()
@@ -0,0 +1,203 @@
+"""
+Batch re-extraction of ``medical_entities`` for stored notes.
+
+    python -m nlp.backfill [--users alice,bob] [--batch-size 64] [--processes 2]
+                           [--sentiment] [--dry-run] [--restart]
+
+Run after upgrading the SciSpacy model or changing the rules in nlp.ner.
+Every user's notes are streamed, oldest first, through one ``nlp.pipe``
+call (batched, across ``--processes`` workers), and the results are written
+back through storage.notes in batches. Each rewritten note is stamped with
+the extractor version, and each finished user is recorded in a checkpoint
+file, so an interrupted run resumes where it stopped. Stored notes only
+keep the redacted text, so that is what gets re-analysed.
+
+``--sentiment`` also rescores diary sentiment (nlp.sentiment.score_batch
+per write batch, the same whole-text score the app stores) on notes not
+yet stamped with the current sentiment version.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+
+from nlp import ner, sentiment
+from storage import notes as note_store
+from storage import users as user_store
+from storage.atomic import StaleVersionError, atomic_write
+from storage.paths import DATA_DIR
+
+CHECKPOINT_FILE = os.path.join(DATA_DIR, "ner_backfill.json")
+WRITE_BATCH = 200
+
+
+def _has_sentiment(note):
+    return isinstance(note.get("diary"), dict) and "sentiment" in note["diary"]
+
+
+def _is_stale(note, version, sentiment_version=None):
+    if not note.get("raw_text_redacted"):
+        return False
+    if "medical_entities" in note and note.get("ner_version") != version:
+        return True
+    return (sentiment_version is not None and _has_sentiment(note)
+            and note.get("sentiment_version") != sentiment_version)
+
+
+def read_checkpoint(version):
+    """Users already finished by an earlier run with the same extractor version."""
+    try:
+        with open(CHECKPOINT_FILE, "r") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if checkpoint.get("version") != version:
+        return set()
+    return set(checkpoint.get("done", []))
+
+
+def write_checkpoint(version, done):
+    atomic_write(CHECKPOINT_FILE, json.dumps({"version": version, "done": sorted(done)}))
+
+
+def _stale_notes(usernames, version, sentiment_version, stats):
+    """``(username, stored version, note)`` for every note whose analysis needs redoing."""
+    for username in usernames:
+        stored_version = note_store.notes_version(username)
+        for note in note_store.load_notes(username):
+            stats["scanned"] += 1
+            if _is_stale(note, version, sentiment_version):
+                yield username, stored_version, note
+        # Marks the end of a user, so it can be checkpointed even with nothing to redo.
+        yield username, None, None
+
+
+def _restamped(note, fields):
+    """``note`` with the re-analysed ``fields``; a sentiment score goes into its diary record."""
+    fields = dict(fields)
+    score = fields.pop("sentiment", None)
+    out = dict(note, **fields)
+    if score is not None and _has_sentiment(note):
+        out["diary"] = dict(note["diary"], sentiment=score)
+    return out
+
+
+def _write(username, stored_version, batch):
+    """
+    Saves one batch, skipping notes the user edited or deleted since they
+    were read. Returns the stored version to expect for the next batch.
+    """
+    for _ in range(note_store.UPDATE_ATTEMPTS):
+        try:
+            note_store.save_notes(username, [_restamped(n, f) for n, f in batch],
+                                  expected_version=stored_version)
+            return note_store.notes_version(username)
+        except StaleVersionError:
+            # Another writer (or a compaction) got there first: re-read once
+            # and keep only the notes whose text is still what was analysed.
+            stored_version = note_store.notes_version(username)
+            current = {n.get("id"): n for n in note_store.load_notes(username)}
+            batch = [(current[n["id"]], f) for n, f in batch
+                     if n["id"] in current
+                     and current[n["id"]].get("raw_text_redacted") == n.get("raw_text_redacted")]
+    # Left unstamped; the next run retries them.
+    return note_store.notes_version(username)
+
+
+def backfill(usernames, batch_size=64, processes=1, dry_run=False, restart=False,
+             rescore_sentiment=False, log=print):
+    """Re-extracts entities (and optionally sentiment) for ``usernames``. Returns a stats dict."""
+    nlp = ner.load_model()
+    version = ner.extractor_version(nlp)
+    sentiment_version = sentiment.VERSION if rescore_sentiment else None
+    run_version = version if sentiment_version is None else f"{version}+{sentiment_version}"
+    done = set() if restart or dry_run else read_checkpoint(run_version)
+    todo = [u for u in usernames if u not in done]
+    stats = {"version": run_version, "users": 0, "scanned": 0, "processed": 0, "changed": 0,
+             "skipped_users": len(usernames) - len(todo)}
+    load_seconds = ner.metrics()["load_seconds"]
+    if load_seconds is not None:
+        log(f"Loaded {ner.MODEL_NAME} in {load_seconds:.1f} s.")
+    log(f"Extractor {run_version}; {len(todo)} user(s) to scan, {stats['skipped_users']} already done.")
+
+    # Texts are pulled from here by nlp.pipe; the matching notes wait in the
+    # queue until their entities come back, in the same order.
+    waiting = deque()
+
+    def texts():
+        for item in _stale_notes(todo, version, sentiment_version, stats):
+            waiting.append(item)
+            if item[2] is not None:
+                yield item[2]["raw_text_redacted"]
+
+    batch = []
+    expected = {}  # username -> stored version the next write of theirs expects
+
+    def flush(username):
+        if sentiment_version is not None:
+            rescored = [fields for note, fields in batch if _has_sentiment(note)]
+            scores = sentiment.score_batch([fields["text"] for fields in rescored])
+            for fields, score in zip(rescored, scores):
+                fields["sentiment"] = score
+                fields["sentiment_version"] = sentiment_version
+        for note, fields in batch:
+            del fields["text"]
+            restamped = _restamped(note, fields)
+            if any(restamped.get(k) != note.get(k) for k in ("medical_entities", "diary")):
+                stats["changed"] += 1
+        if batch and not dry_run:
+            expected[username] = _write(username, expected[username], batch)
+        batch.clear()
+
+    def drain_markers():
+        # Finishes every user whose end marker is at the head of the queue.
+        while waiting and waiting[0][2] is None:
+            username, _, _ = waiting.popleft()
+            flush(username)
+            stats["users"] += 1
+            if not dry_run:
+                done.add(username)
+                write_checkpoint(run_version, done)
+            log(f"  {username}: done ({stats['processed']} notes analysed so far)")
+
+    t0 = time.perf_counter()
+    for entities in ner.extract_many(texts(), nlp, batch_size=batch_size, n_process=processes):
+        drain_markers()
+        username, stored_version, note = waiting.popleft()
+        expected.setdefault(username, stored_version)
+        stats["processed"] += 1
+        batch.append((note, {"text": note["raw_text_redacted"], "medical_entities": entities,
+                             "ner_version": version}))
+        if len(batch) >= WRITE_BATCH:
+            flush(username)
+    drain_markers()
+
+    elapsed = time.perf_counter() - t0
+    stats["seconds"] = elapsed
+    stats["docs_per_sec"] = stats["processed"] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", help="comma-separated usernames (default: every account)")
+    parser.add_argument("--batch-size", type=int, default=64, help="texts per nlp.pipe batch")
+    parser.add_argument("--processes", type=int, default=1, help="nlp.pipe worker processes")
+    parser.add_argument("--sentiment", action="store_true", help="also rescore diary sentiment")
+    parser.add_argument("--dry-run", action="store_true", help="analyse and report, write nothing")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args(argv)
+
+    usernames = args.users.split(",") if args.users else sorted(user_store.load_users_db())
+    stats = backfill(usernames, args.batch_size, args.processes, args.dry_run, args.restart,
+                     rescore_sentiment=args.sentiment)
+    note_store.flush_writes()
+    verb = "would change" if args.dry_run else "changed"
+    print(f"Scanned {stats['scanned']} notes of {stats['users']} user(s); analysed "
+          f"{stats['processed']} in {stats['seconds']:.1f} s ({stats['docs_per_sec']:.0f} docs/sec); "
+          f"{verb} {stats['changed']}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Content-addressed cache of text analysis results.
+
+Entries are keyed by a SHA-256 of the analysed (redacted, normalized) text
+and the analyser version, so a model upgrade or a rules edit never serves a
+stale result. Values are ``{stage: result}`` dicts for the NER, sentiment
+and tag stages. A bounded in-memory LRU sits in front of an
+optional on-disk tier (one small JSON file per key under
+``ANALYSIS_CACHE_DIR``), which survives restarts and is shared by all
+server processes.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from storage.atomic import atomic_write
+
+MEMORY_ENTRIES = int(os.getenv("ANALYSIS_CACHE_ENTRIES", "2048"))
+DISK_DIR = os.getenv("ANALYSIS_CACHE_DIR") or None  # unset: memory only
+
+
+def cache_key(text, version):
+    return hashlib.sha256(f"{version}\0{text}".encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, max_entries=MEMORY_ENTRIES, disk_dir=DISK_DIR):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()  # key -> {stage: result}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def _remember(self, key, value):
+        # Caller holds the lock.
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """The cached ``{stage: result}`` for ``key``, or None. Do not mutate it."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.disk_dir:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self.disk_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                atomic_write(path, json.dumps(value))
+            except OSError:
+                pass  # The disk tier is best effort.
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared():
+    """The process-wide cache, configured from the environment."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AnalysisCache()
+        return _shared
@@ -0,0 +1,132 @@
+"""
+Compiled keyword rules: red flags, diary tags, fallback symptoms and entity
+categories.
+
+The term lists live in keyword_rules.json as ``{rule set: {category:
+[terms]}}``. Each rule set is compiled once, at import, into a single regex
+shaped like a trie of its terms. One pass over the lowercased text finds
+the longest term at each position where any term starts (resuming one
+character after each match start, so overlapping terms are not missed), and
+terms that are prefixes of a match are credited too. The result is the same
+as testing ``term in text`` for every term, but the scan runs in the regex
+engine and its cost grows with the text length and term depth rather than
+with the number of terms.
+
+Below ``SMALL_RULE_SET`` terms a rule set is matched with plain substring
+tests instead: for a handful of short terms those beat any regex (see
+benchmarks/bench_keywords.py), and the results are identical.
+"""
+import hashlib
+import json
+import os
+import re
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_rules.json")
+SMALL_RULE_SET = 200
+
+
+def _trie_pattern(terms):
+    trie = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def pattern(node):
+        end = node.get("") is True
+        branches = [re.escape(ch) + pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy, so the longest term at a position wins; shorter ones are
+        # recovered from its prefixes.
+        return "(?:" + body + ")?" if end else body
+
+    return pattern(trie)
+
+
+class KeywordMatcher:
+    """One compiled rule set: ``{category: [terms]}``, matched case-insensitively as substrings."""
+
+    __slots__ = ("categories", "_rules", "_regex", "_prefix_terms", "_term_categories")
+
+    def __init__(self, rules):
+        self.categories = tuple(rules)
+        term_categories = {}
+        for category, terms in rules.items():
+            for term in terms:
+                term = term.lower()
+                if term:
+                    term_categories.setdefault(term, []).append(category)
+        # For the longest match at a position, every term it starts with.
+        self._prefix_terms = {
+            term: tuple(term[:i] for i in range(1, len(term) + 1) if term[:i] in term_categories)
+            for term in term_categories
+        }
+        self._term_categories = term_categories
+        self._rules = None
+        self._regex = None
+        if len(term_categories) < SMALL_RULE_SET:
+            self._rules = [(c, [t.lower() for t in terms if t]) for c, terms in rules.items()]
+        else:
+            self._regex = re.compile(_trie_pattern(term_categories))
+
+    def terms(self, text, lowered=False):
+        """Every term that occurs in ``text`` (``lowered`` if the caller already lowercased it)."""
+        if not text:
+            return set()
+        if not lowered:
+            text = text.lower()
+        if self._rules is not None:
+            return {t for t in self._term_categories if t in text}
+        found = set()
+        for longest in self._scan(text):
+            found.update(self._prefix_terms[longest])
+        return found
+
+    def _scan(self, text):
+        """The longest term at each position of (lowercased) ``text`` where one starts."""
+        search = self._regex.search
+        match = search(text)
+        while match is not None:
+            yield match.group()
+            match = search(text, match.start() + 1)
+
+    def matches(self, text, lowered=False):
+        """The categories with at least one term in ``text``, in rule order."""
+        text = text or ""
+        if not lowered:
+            text = text.lower()
+        if self._rules is not None:
+            return [c for c, terms in self._rules if any(t in text for t in terms)]
+        hit = set()
+        for longest in self._scan(text):
+            for term in self._prefix_terms[longest]:
+                hit.update(self._term_categories[term])
+            if len(hit) == len(self.categories):
+                break
+        return [c for c in self.categories if c in hit]
+
+    def first(self, text):
+        """The first category, in rule order, with a term in ``text``; None if there is none."""
+        found = self.matches(text)
+        return found[0] if found else None
+
+
+def load_rules(path=RULES_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _digest(rules):
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+
+_rules = load_rules()
+RULES_DIGEST = _digest(_rules)
+_matchers = {name: KeywordMatcher(rule_set) for name, rule_set in _rules.items()}
+
+
+def matcher(name):
+    return _matchers[name]
@@ -0,0 +1,158 @@
+"""
+Medical concept extraction: SciSpacy NER, regex vitals and keyword fallbacks.
+
+Shared by the app (one text at a time) and the batch backfill job, which
+streams texts through ``nlp.pipe``. Works without spaCy or the model, in
+which case only the regex and keyword rules apply.
+
+Only ``doc.ents`` is read, so the pipeline is loaded without the tagger,
+parser, lemmatizer and friends. ``warm_up()`` loads it in a background
+thread at process start, so the first request does not pay for it, and
+``metrics()`` reports the load time and per-document latency.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+from nlp import keywords
+
+try:
+    import spacy
+    HAS_SPACY = True
+except ImportError:
+    HAS_SPACY = False
+
+MODEL_NAME = os.getenv("NER_MODEL", "en_core_sci_sm")
+# Bump whenever the categorisation code below changes, so the backfill job
+# knows which stored entities are stale. Edits to keyword_rules.json are
+# picked up through keywords.RULES_DIGEST.
+RULES_VERSION = 1
+CATEGORIES = ("symptoms", "conditions", "medications", "vitals", "procedures")
+# Components NER does not need; names missing from a given model are ignored.
+EXCLUDED_COMPONENTS = ("tagger", "morphologizer", "attribute_ruler", "lemmatizer",
+                       "parser", "senter")
+WARM_UP_TEXT = "Patient reports a mild headache and fever since yesterday, took ibuprofen 200 mg."
+
+_BP = re.compile(r'\b\d{2,3}/\d{2,3}\b')
+_TEMP = re.compile(r'\b(temp(erature)?|t)\s*[:=]?\s*(\d{2,3}(\.\d)?)\b')
+_HR = re.compile(r'\b(hr|pulse|heart rate)\s*[:=]?\s*(\d{2,3})\b')
+
+logger = logging.getLogger(__name__)
+
+_model = None  # False once loading failed
+_model_lock = threading.Lock()
+_warm_thread = None
+_metrics = {"load_seconds": None, "docs": 0, "doc_seconds": 0.0}
+_metrics_lock = threading.Lock()
+
+
+def load_model():
+    """
+    The NER-only spaCy pipeline, loaded once per process; None when
+    unavailable. Blocks while a warm-up load is in progress.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = False
+            if HAS_SPACY:
+                t0 = time.perf_counter()
+                try:
+                    _model = spacy.load(MODEL_NAME, exclude=list(EXCLUDED_COMPONENTS))
+                except Exception:
+                    logger.warning("NER model %s unavailable; using keyword rules only", MODEL_NAME)
+                else:
+                    _metrics["load_seconds"] = time.perf_counter() - t0
+                    logger.info("Loaded %s [%s] in %.2f s", MODEL_NAME,
+                                ", ".join(_model.pipe_names), _metrics["load_seconds"])
+    return _model or None
+
+
+def _warm():
+    nlp = load_model()
+    if nlp is not None:
+        # The first call allocates buffers and fills the vocab caches.
+        nlp(WARM_UP_TEXT)
+
+
+def warm_up():
+    """Starts loading the model in a background thread. Safe to call on every rerun."""
+    global _warm_thread
+    with _metrics_lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=_warm, name="ner-warm-up", daemon=True)
+            _warm_thread.start()
+
+
+def _record(seconds):
+    with _metrics_lock:
+        _metrics["docs"] += 1
+        _metrics["doc_seconds"] += seconds
+
+
+def metrics():
+    """Model load time (None until loaded) and per-document extraction latency."""
+    with _metrics_lock:
+        out = dict(_metrics)
+    out["pipeline"] = list(_model.pipe_names) if _model else []
+    out["ms_per_doc"] = 1000 * out["doc_seconds"] / out["docs"] if out["docs"] else None
+    return out
+
+
+def extractor_version(nlp):
+    """Identifies the model and rules that produced a set of entities."""
+    rules = f"{RULES_VERSION}-{keywords.RULES_DIGEST}"
+    if nlp is None:
+        return f"keywords/{rules}"
+    return f"{MODEL_NAME}-{nlp.meta.get('version', '')}/{rules}"
+
+
+def entities(text, doc=None, text_lower=None):
+    """
+    Entities by category from ``text``, its spaCy ``doc`` (None for the
+    keyword rules only) and, if already computed, its lowercased form.
+    """
+    found = {k: set() for k in CATEGORIES}
+    if text_lower is None:
+        text_lower = text.lower()
+
+    found["vitals"].update(f"BP: {m}" for m in _BP.findall(text))
+    found["vitals"].update(f"Temp: {t[2]}" for t in _TEMP.findall(text_lower))
+    found["vitals"].update(f"HR: {h[1]}" for h in _HR.findall(text_lower))
+
+    if doc is not None:
+        categorize = keywords.matcher("entity_categories").first
+        for ent in doc.ents:
+            found[categorize(ent.text) or "conditions"].add(ent.text)
+
+    found["symptoms"].update(keywords.matcher("fallback_symptoms").terms(text_lower, lowered=True))
+
+    return {k: sorted(v) for k, v in found.items()}
+
+
+def extract(text, nlp=None):
+    """Entities of one text, by category."""
+    t0 = time.perf_counter()
+    found = entities(text, nlp(text) if nlp is not None else None)
+    _record(time.perf_counter() - t0)
+    return found
+
+
+def extract_many(texts, nlp=None, batch_size=64, n_process=1):
+    """
+    Entities of each text, in order, streamed through ``nlp.pipe`` in
+    batches of ``batch_size`` across ``n_process`` worker processes.
+    """
+    if nlp is None:
+        pairs = ((text, None) for text in texts)
+    else:
+        pairs = ((doc.text, doc) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process))
+    t0 = time.perf_counter()
+    for text, doc in pairs:
+        found = entities(text, doc)
+        # Includes this document's share of its nlp.pipe batch, not the caller's time.
+        _record(time.perf_counter() - t0)
+        yield found
+        t0 = time.perf_counter()
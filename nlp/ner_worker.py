@@ -0,0 +1,210 @@
+"""
+Shared NER worker: one process loads the model for every app replica.
+
+    python -m nlp.ner_worker [--socket /run/ner/ner.sock] [--batch-size 64]
+
+Run one per host and point each replica at its Unix socket (``NER_SOCKET``)
+instead of having every Streamlit process hold its own copy of SciSpacy.
+Each request is one line of JSON, ``{"texts": [...]}``, answered with
+``{"version": extractor version, "entities": [{category: [...]}, ...]}``
+(an empty ``texts`` list just asks for the version). Requests that arrive
+while a batch is in ``nlp.pipe`` are queued and go through together in the
+next one, so concurrent chats share batches without waiting on a timer.
+
+The app side is ``client()``: the shared Client while the worker answers,
+None while it is down (rechecked every ``RETRY_SECONDS``), in which case the
+app loads the model in-process as before. A call that fails midway raises
+WorkerUnavailable.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from nlp import ner
+
+SOCKET_PATH = os.getenv("NER_SOCKET") or os.path.join(tempfile.gettempdir(), "ner-worker.sock")
+TIMEOUT = float(os.getenv("NER_WORKER_TIMEOUT", "10"))  # seconds per request
+RETRY_SECONDS = 30
+BATCH_SIZE = 64
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerUnavailable(Exception):
+    pass
+
+
+class _Batcher:
+    """Runs queued requests through the model, everything queued at once."""
+
+    def __init__(self, nlp, batch_size=BATCH_SIZE):
+        self.nlp = nlp
+        self.version = ner.extractor_version(nlp)
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+
+    def submit(self, texts):
+        """Entities of each text; blocks until its batch is done."""
+        item = {"texts": texts, "done": threading.Event(), "result": None}
+        self._queue.put(item)
+        item["done"].wait()
+        if isinstance(item["result"], Exception):
+            raise item["result"]
+        return item["result"]
+
+    def run(self):
+        while True:
+            pending = [self._queue.get()]
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            texts = [text for item in pending for text in item["texts"]]
+            error = None
+            try:
+                results = list(ner.extract_many(texts, self.nlp, batch_size=self.batch_size))
+            except Exception as e:
+                logger.exception("NER batch of %d texts failed", len(texts))
+                error = e
+            start = 0
+            for item in pending:
+                end = start + len(item["texts"])
+                item["result"] = error if error is not None else results[start:end]
+                start = end
+                item["done"].set()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        batcher = self.server.batcher
+        for line in self.rfile:
+            try:
+                texts = json.loads(line)["texts"]
+                reply = {"version": batcher.version,
+                         "entities": batcher.submit(texts) if texts else []}
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog; the default 5 refuses bursts of chats
+
+
+def serve(path=SOCKET_PATH, batch_size=BATCH_SIZE):
+    """Loads the model, then serves requests on ``path`` until interrupted."""
+    try:
+        Client(path).version()
+    except WorkerUnavailable:
+        pass
+    else:
+        raise SystemExit(f"A NER worker is already serving {path}.")
+    if os.path.exists(path):
+        os.unlink(path)  # left behind by a worker that did not shut down cleanly
+
+    nlp = ner.load_model()
+    if nlp is not None:
+        nlp(ner.WARM_UP_TEXT)
+    batcher = _Batcher(nlp, batch_size)
+    threading.Thread(target=batcher.run, name="ner-batcher", daemon=True).start()
+
+    server = _Server(path, _Handler)
+    server.batcher = batcher
+    # Stopped like a container (SIGTERM), still remove the socket on the way out.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.info("NER worker %s serving %s", batcher.version, path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+class Client:
+    """Talks to the worker; one short connection per call, so it is thread-safe."""
+
+    def __init__(self, path=SOCKET_PATH, timeout=TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._version = None
+        self._down_until = 0.0
+
+    def _request(self, texts):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                sock.sendall(json.dumps({"texts": texts}).encode("utf-8") + b"\n")
+                with sock.makefile("rb") as f:
+                    line = f.readline()
+            reply = json.loads(line) if line else {"error": "connection closed without a reply"}
+        except (OSError, ValueError) as e:
+            raise WorkerUnavailable(str(e)) from e
+        if "error" in reply:
+            raise WorkerUnavailable(reply["error"])
+        return reply
+
+    def _call(self, texts):
+        try:
+            reply = self._request(texts)
+        except WorkerUnavailable:
+            self._version = None
+            self._down_until = time.monotonic() + RETRY_SECONDS
+            raise
+        self._version = reply["version"]
+        return reply["entities"]
+
+    def version(self):
+        """The worker's extractor version (see ner.extractor_version)."""
+        if self._version is None:
+            self._call([])
+        return self._version
+
+    def available(self):
+        if time.monotonic() < self._down_until:
+            return False
+        try:
+            self.version()
+        except WorkerUnavailable:
+            return False
+        return True
+
+    def extract(self, text):
+        return self._call([text])[0]
+
+    def extract_many(self, texts):
+        return self._call(list(texts))
+
+
+_client = Client()
+
+
+def client():
+    """The shared Client if the worker is up, else None."""
+    return _client if _client.available() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path (default: $NER_SOCKET)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="texts per nlp.pipe batch")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    serve(args.socket, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
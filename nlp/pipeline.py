@@ -0,0 +1,152 @@
+"""
+Single-pass analysis of one piece of user text.
+
+``analyze(text)`` redacts PHI first, then builds one Document from the
+redacted text: whitespace-normalized and lowercased once, with the spaCy
+doc computed at most once, on demand. Every stage reads that shared
+document: vitals and medical entities, sentiment and diary tags. Nothing
+downstream sees the raw text, so no unredacted PHI ends up in stored
+entities or summaries. The one exception is the red-flag check, which runs
+on the raw text (redaction can swallow a phrase like "name: Chest Pain")
+and only yields terms from its fixed list. The result carries per-stage
+timings.
+
+With a cache (nlp.cache), stage results are looked up by a hash of the
+normalized text and the analyser version first, so a repeated text skips
+spaCy and VADER entirely. With a ``worker`` (an nlp.ner_worker.Client) the
+entities come from the shared NER worker process instead of an in-process
+model.
+"""
+import time
+import unicodedata
+
+from nlp import keywords, ner, sentiment
+from nlp.cache import cache_key
+from nlp.redaction import redact
+
+STAGES = ("redact", "normalize", "ner", "sentiment", "tags", "red_flags")
+CACHED_STAGES = ("ner", "sentiment", "tags")
+NEGATIVE_SENTIMENT = -0.2
+SUMMARY_CHARS = 50
+
+def version(nlp=None, worker=None):
+    """Identifies everything that determines the cached stage results."""
+    extractor = worker.version() if worker is not None else ner.extractor_version(nlp)
+    return f"{extractor}|{sentiment.VERSION}"
+
+
+def normalize(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class Document:
+    """The redacted text as every stage reads it."""
+
+    __slots__ = ("text", "lower", "_nlp", "_spacy_doc")
+
+    def __init__(self, text, nlp=None):
+        self.text = normalize(text)
+        self.lower = self.text.lower()
+        self._nlp = nlp
+        self._spacy_doc = None
+
+    @property
+    def spacy_doc(self):
+        if self._spacy_doc is None and self._nlp is not None and self.text:
+            self._spacy_doc = self._nlp(self.text)
+        return self._spacy_doc
+
+
+class AnalysisResult:
+    __slots__ = ("redacted", "entities", "vitals", "sentiment", "tags", "red_flags",
+                 "timings", "cached")
+
+    def __init__(self):
+        self.redacted = ""
+        self.entities = {k: [] for k in ner.CATEGORIES}
+        self.vitals = []
+        self.sentiment = 0.0
+        self.tags = []
+        self.red_flags = None  # None unless the red_flags stage ran
+        self.timings = {}  # stage -> ms
+        self.cached = ()   # stages served from the cache
+
+    @property
+    def has_medical(self):
+        return any(self.entities.values())
+
+    def diary(self):
+        """The ``diary`` record stored with a note (what process_diary_logic used to build)."""
+        suggestions = []
+        if self.sentiment < NEGATIVE_SENTIMENT:
+            suggestions.append("- Consider rest, hydration, talking to someone you trust, or a clinician if concerned.")
+        return {"sentiment": self.sentiment, "tags": list(self.tags), "suggestions": suggestions,
+                "summary": self.redacted[:SUMMARY_CHARS] + "..."}
+
+
+def _run_stage(stage, doc, worker=None):
+    if stage == "ner":
+        if worker is not None:
+            return worker.extract(doc.text)
+        return ner.entities(doc.text, doc.spacy_doc, doc.lower)
+    if stage == "sentiment":
+        return sentiment.score(doc.text)
+    if stage == "tags":
+        return keywords.matcher("diary_tags").matches(doc.lower, lowered=True)
+    raise ValueError(stage)
+
+
+def red_flags(text):
+    """The red-flag terms in ``text``; meant for the raw text, before redaction."""
+    return sorted(keywords.matcher("red_flags").terms(normalize(text).lower(), lowered=True))
+
+
+def analyze(text, nlp=None, stages=STAGES, cache=None, worker=None):
+    """
+    Runs the requested ``stages`` (redaction and normalization always run)
+    over ``text``. ``nlp`` is the spaCy pipeline for entity recognition, or
+    None for the keyword rules only; ``cache`` an nlp.cache.AnalysisCache;
+    ``worker`` an nlp.ner_worker.Client to use instead of ``nlp`` (raises
+    WorkerUnavailable if it goes down).
+    """
+    result = AnalysisResult()
+    clock = time.perf_counter
+
+    if "red_flags" in stages:
+        t0 = clock()
+        result.red_flags = red_flags(text or "")
+        result.timings["red_flags"] = (clock() - t0) * 1000
+
+    t0 = clock()
+    result.redacted = redact(text or "")
+    t1 = clock()
+    result.timings["redact"] = (t1 - t0) * 1000
+
+    doc = Document(result.redacted, nlp)
+    key = cache_key(doc.text, version(nlp, worker)) if cache is not None else None
+    cached = (cache.get(key) if cache is not None else None) or {}
+    t0, t1 = t1, clock()
+    result.timings["normalize"] = (t1 - t0) * 1000
+
+    values = {}
+    for stage in CACHED_STAGES:
+        if stage not in stages:
+            continue
+        if stage in cached:
+            values[stage] = cached[stage]
+        else:
+            values[stage] = _run_stage(stage, doc, worker)
+        t0, t1 = t1, clock()
+        result.timings[stage] = (t1 - t0) * 1000
+
+    result.cached = tuple(s for s in values if s in cached)
+    if cache is not None and len(result.cached) < len(values):
+        cache.put(key, dict(cached, **values))
+
+    if "ner" in values:
+        # Copies, so callers can edit them without touching the cache.
+        result.entities = {k: list(v) for k, v in values["ner"].items()}
+        result.vitals = result.entities["vitals"]
+    result.sentiment = values.get("sentiment", 0.0)
+    result.tags = list(values.get("tags", ()))
+    return result
@@ -0,0 +1,159 @@
+"""
+PHI redaction of free text before it is stored or analysed.
+
+The rules live in redaction_rules.json as ``{pack: [{name, pattern,
+replacement}]}``; ``REDACTION_PACKS`` (comma-separated, default ``core``,
+the rules redaction always applied; ``identifiers`` and ``address`` are
+opt-in) picks which are applied. The chosen rules are compiled once into a
+single alternation, so a text is scanned once however many rules there
+are, instead of once per rule. Where two rules match at the same position
+the earlier one (pack order, then rule order) wins. Replacements may refer
+to the rule's own groups as ``\\1``, ``\\2``...
+
+One scan is not byte-for-byte the old one ``re.sub`` per rule when
+matches of different rules overlap, which only happens in run-together
+text: the match starting first wins rather than the rule listed first, so
+``(555) 123-4567a@b.co`` gives ``[REDACTED_PHONE][REDACTED_EMAIL]`` where
+the email pass used to leave ``(555) `` behind.
+
+Each pattern should start with a plain character or class (``[dD](?i:ob)``
+rather than ``(?i:dob)``, ``\\d(?<!\\w\\d)`` rather than ``\\b\\d``): the
+regex engine then rules a rule out at most positions with one character
+test, which is what keeps the combined scan ahead of separate passes (see
+benchmarks/bench_redaction.py). A leading run must also be bounded or
+anchored, or every position of a long token rescans the rest of it. The
+email rule caps its local part at 64 characters (the RFC limit) instead of
+anchoring it with ``(?<![\\w.-])``, which would leave an address that
+runs into the end of another rule's match unredacted
+(``DOB: 1984-03-12jane@x.com``).
+
+``Redactor.stream`` redacts an iterable of chunks (a long transcript, an
+uploaded document) without holding it all in memory. Text is only emitted
+once no match could still start in it or run past it, so a match split
+across chunks is redacted exactly as in the whole text, as long as it is
+no longer than ``window`` characters.
+"""
+import json
+import os
+import re
+import threading
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "redaction_rules.json")
+WINDOW = 256   # longest match streaming guarantees to catch across chunks
+CONTEXT = 32   # characters kept before the scan position, for \b and lookbehinds
+
+_GROUP_REF = re.compile(r'\\(\d+)')
+
+
+def _template(replacement):
+    """``replacement`` as literal strings and group numbers, for ``_expand``."""
+    parts = []
+    for i, piece in enumerate(_GROUP_REF.split(replacement)):
+        if i % 2:
+            parts.append(int(piece))
+        elif piece:
+            parts.append(piece)
+    return parts
+
+
+class Redactor:
+    """A compiled set of redaction rules."""
+
+    def __init__(self, rules, window=WINDOW):
+        self.names = [r["name"] for r in rules]
+        self.window = window
+        branches = []
+        self._rules = {}  # marker group number -> (name, group before the rule's own, template)
+        group = 0
+        for rule in rules:
+            pattern = re.compile(rule["pattern"])  # fails here, naming the bad rule, not below
+            # An empty group closing each branch tells which rule matched; a
+            # group around the branch would hide its first character from the
+            # regex engine's quick per-position reject.
+            marker = group + pattern.groups + 1
+            self._rules[marker] = (rule["name"], group, _template(rule.get("replacement", "")))
+            branches.append(f"(?:{rule['pattern']})()")
+            group = marker
+        self._pattern = re.compile("|".join(branches)) if branches else None
+
+    def _expand(self, match, counts):
+        # The marker closes after the rule's own groups, so it is lastindex.
+        name, base, template = self._rules[match.lastindex]
+        if counts is not None:
+            counts[name] = counts.get(name, 0) + 1
+        return "".join(p if isinstance(p, str) else (match.group(base + p) or "") for p in template)
+
+    def _redact_span(self, text, pos, limit, counts):
+        """
+        Redacts ``text`` from ``pos``. With a ``limit``, stops before any
+        match starting at or after it, or reaching the end of ``text`` (more
+        input might change it). Returns the redacted piece and where it ends.
+        """
+        parts = []
+        stop = limit
+        for match in self._pattern.finditer(text, pos):
+            if limit is not None and (match.start() >= limit or match.end() == len(text)):
+                stop = min(limit, match.start())
+                break
+            parts.append(text[pos:match.start()])
+            parts.append(self._expand(match, counts))
+            pos = match.end()
+        end = len(text) if stop is None else max(pos, stop)
+        parts.append(text[pos:end])
+        return "".join(parts), end
+
+    def redact(self, text, counts=None):
+        """
+        ``text`` with every rule's matches replaced. Pass a dict as ``counts``
+        to have it incremented by the number of matches per rule name.
+        """
+        if not text or self._pattern is None:
+            return text
+        return self._redact_span(text, 0, None, counts)[0]
+
+    def stream(self, chunks, counts=None):
+        """Yields the redacted text of ``chunks`` (an iterable of str) piece by piece."""
+        if self._pattern is None:
+            yield from chunks
+            return
+        buffer, pos = "", 0
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) - pos < 2 * self.window:
+                continue
+            piece, pos = self._redact_span(buffer, pos, len(buffer) - self.window, counts)
+            if piece:
+                yield piece
+            keep = max(0, pos - CONTEXT)
+            buffer, pos = buffer[keep:], pos - keep
+        piece, _ = self._redact_span(buffer, pos, None, counts)
+        if piece:
+            yield piece
+
+
+def load_packs(path=RULES_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_packs = load_packs()
+DEFAULT_PACKS = tuple(p.strip() for p in os.getenv("REDACTION_PACKS", "core").split(",") if p.strip())
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def engine(packs=None):
+    """The shared Redactor for ``packs`` (names in redaction_rules.json; default DEFAULT_PACKS)."""
+    packs = tuple(packs or DEFAULT_PACKS)
+    with _engines_lock:
+        if packs not in _engines:
+            unknown = [p for p in packs if p not in _packs]
+            if unknown:
+                raise ValueError(f"Unknown redaction pack(s): {', '.join(unknown)}")
+            _engines[packs] = Redactor([rule for p in packs for rule in _packs[p]])
+        return _engines[packs]
+
+
+def redact(text, counts=None):
+    return engine().redact(text, counts)
@@ -0,0 +1,78 @@
+"""
+Sentiment scoring with one VADER analyzer per process.
+
+Building a SentimentIntensityAnalyzer reads and parses the lexicon files, so
+it is done once, lazily and thread-safely, and shared by every caller.
+``score`` is VADER's compound score of the whole text, the value stored as
+a note's mood. ``score_by_sentence`` is the opt-in alternative for long
+dictations: the mean of the sentences' compound scores, since VADER is
+tuned for sentence-length input and saturates towards +/-1 on long
+passages. ``score_batch`` scores many texts for backfills and analytics
+rebuilds.
+Without vaderSentiment installed every score is 0.0.
+"""
+import re
+import threading
+
+try:
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    HAS_VADER = True
+except ImportError:
+    HAS_VADER = False
+
+# Bump when the scoring rules below change; part of the analysis cache key.
+VERSION = "vader-2" if HAS_VADER else "none"
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n+')
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def analyzer():
+    """The shared SentimentIntensityAnalyzer, or None without vaderSentiment."""
+    global _analyzer
+    if _analyzer is None and HAS_VADER:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def sentences(text):
+    return [s.strip() for s in _SENTENCE_END.split(text or "") if s.strip()]
+
+
+def score_sentences(text):
+    """``[(sentence, compound)]`` for every sentence of ``text``."""
+    vader = analyzer()
+    if vader is None:
+        return [(s, 0.0) for s in sentences(text)]
+    return [(s, vader.polarity_scores(s)["compound"]) for s in sentences(text)]
+
+
+def score(text):
+    """Compound sentiment of the whole text, in [-1, 1]."""
+    vader = analyzer()
+    if vader is None or not text:
+        return 0.0
+    return vader.polarity_scores(text)["compound"]
+
+
+def score_by_sentence(text):
+    """Mean compound sentiment of ``text``'s sentences, in [-1, 1]."""
+    scored = score_sentences(text)
+    if not scored:
+        return 0.0
+    return sum(c for _, c in scored) / len(scored)
+
+
+def score_batch(texts):
+    """``score`` of each text, in order; repeated texts are scored once."""
+    seen = {}
+    out = []
+    for text in texts:
+        if text not in seen:
+            seen[text] = score(text)
+        out.append(seen[text])
+    return out
@@ -0,0 +1,257 @@
+"""
+BM25 full-text search over a user's notes.
+
+Indexes the redacted text, SOAP text, diary tags and extracted medical
+entities of every note. The index is a derived index of the note store,
+built once per user version and extended by each save.
+
+It is organised like a log-structured search engine: a list of immutable
+segments, each holding NumPy posting arrays (``term -> (docs, tf)``) and
+per-document length/date/mode columns. A save adds a small segment for its
+notes; adjacent segments of similar size are merged, so a save costs
+amortized O(log n) array copies and never re-tokenizes history. A query
+scores only the posting lists of its own terms, vectorized per segment.
+
+Each archived month's segment is stored with the archive as a summary, so a
+rebuild loads postings instead of decompressing and re-tokenizing old
+months. Those segments hold ``(month, id)`` references rather than notes;
+``search`` reads the few notes it returns from their archives.
+"""
+from collections import Counter
+from datetime import date
+
+import numpy as np
+
+from search.text import tokens
+from storage import notes as note_store
+
+INDEX_NAME = "fulltext"
+K1 = 1.2
+B = 0.75
+
+
+def note_terms(note):
+    """The searchable tokens of a note, across all indexed fields."""
+    parts = [note.get("raw_text_redacted", "")]
+    soap = note.get("soap")
+    if isinstance(soap, dict):
+        parts.append(soap.get("text", ""))
+    elif soap:
+        parts.append(soap)
+    parts.extend((note.get("diary") or {}).get("tags", []))
+    for values in (note.get("medical_entities") or {}).values():
+        if isinstance(values, (list, tuple)):
+            parts.extend(values)
+        else:
+            parts.append(values)
+    out = []
+    for part in parts:
+        out.extend(tokens(part))
+    return out
+
+
+def _ordinal(value):
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Segment:
+    """Postings and document columns for a run of consecutive documents. Immutable."""
+
+    __slots__ = ("base", "notes", "ids", "lengths", "ordinals", "modes", "postings")
+
+    @classmethod
+    def build(cls, base, notes):
+        postings = {}
+        lengths, ordinals, modes = [], [], []
+        for local, note in enumerate(notes):
+            terms = note_terms(note)
+            lengths.append(len(terms))
+            ordinals.append(_ordinal(note.get("date")))
+            modes.append(note.get("mode") or "")
+            for term, tf in Counter(terms).items():
+                entry = postings.get(term)
+                if entry is None:
+                    postings[term] = ([local], [tf])
+                else:
+                    entry[0].append(local)
+                    entry[1].append(tf)
+        seg = cls()
+        seg.base = base
+        seg.notes = list(notes)
+        seg.ids = frozenset(n.get("id") for n in notes)
+        seg.lengths = np.asarray(lengths, dtype=np.float32)
+        seg.ordinals = np.asarray(ordinals, dtype=np.int32)
+        seg.modes = np.asarray(modes, dtype=object)
+        seg.postings = {term: (np.asarray(d, dtype=np.int32), np.asarray(f, dtype=np.float32))
+                        for term, (d, f) in postings.items()}
+        return seg
+
+    def summary(self):
+        """The segment as JSON, without the notes themselves."""
+        return {"ids": [n.get("id") for n in self.notes],
+                "lengths": self.lengths.astype(int).tolist(),
+                "ordinals": self.ordinals.tolist(),
+                "modes": self.modes.tolist(),
+                "postings": {term: [docs.tolist(), tfs.astype(int).tolist()]
+                             for term, (docs, tfs) in self.postings.items()}}
+
+    @classmethod
+    def from_summary(cls, base, month, data):
+        seg = cls()
+        seg.base = base
+        seg.notes = [(month, note_id) for note_id in data["ids"]]
+        seg.ids = frozenset(data["ids"])
+        seg.lengths = np.asarray(data["lengths"], dtype=np.float32)
+        seg.ordinals = np.asarray(data["ordinals"], dtype=np.int32)
+        seg.modes = np.asarray(data["modes"], dtype=object)
+        seg.postings = {term: (np.asarray(d, dtype=np.int32), np.asarray(f, dtype=np.float32))
+                        for term, (d, f) in data["postings"].items()}
+        return seg
+
+    def __len__(self):
+        return len(self.notes)
+
+    def merged(self, other):
+        """This segment followed by ``other``, which must start where this one ends."""
+        seg = _Segment()
+        seg.base = self.base
+        seg.notes = self.notes + other.notes
+        seg.ids = self.ids | other.ids
+        seg.lengths = np.concatenate([self.lengths, other.lengths])
+        seg.ordinals = np.concatenate([self.ordinals, other.ordinals])
+        seg.modes = np.concatenate([self.modes, other.modes])
+        seg.postings = dict(self.postings)
+        shift = len(self)
+        for term, (docs, tfs) in other.postings.items():
+            mine = seg.postings.get(term)
+            if mine is None:
+                seg.postings[term] = (docs + shift, tfs)
+            else:
+                seg.postings[term] = (np.concatenate([mine[0], docs + shift]),
+                                      np.concatenate([mine[1], tfs]))
+        return seg
+
+
+class FullTextIndex:
+    __slots__ = ("segments", "doc_count", "total_length")
+
+    def __init__(self, segments=()):
+        self.segments = tuple(segments)
+        self.doc_count = sum(len(s) for s in self.segments)
+        self.total_length = float(sum(s.lengths.sum() for s in self.segments))
+
+    def __contains__(self, note_id):
+        return any(note_id in s.ids for s in self.segments)
+
+    def added(self, notes):
+        """A new index with ``notes`` appended; existing segments are shared, not copied."""
+        if not notes:
+            return self
+        return self.with_segment(_Segment.build(self.doc_count, notes))
+
+    def with_segment(self, segment):
+        """A new index with ``segment`` (starting at ``doc_count``) appended."""
+        segments = list(self.segments)
+        segments.append(segment)
+        while len(segments) > 1 and len(segments[-2]) <= 2 * len(segments[-1]):
+            last = segments.pop()
+            segments[-1] = segments[-1].merged(last)
+        return FullTextIndex(segments)
+
+    def search(self, query, since=None, until=None, mode=None, top=None):
+        """
+        ``([(score, note)], total)``: the ``top`` best matches (all if None),
+        best first and newest first on ties, and the number of matches.
+        Archived matches come as ``(month, id)`` instead of the note.
+        """
+        terms = set(tokens(query))
+        if not self.doc_count or not terms:
+            return [], 0
+        avgdl = self.total_length / self.doc_count or 1.0
+        idf = {}
+        for term in terms:
+            df = sum(len(s.postings[term][0]) for s in self.segments if term in s.postings)
+            if df:
+                idf[term] = np.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+        hit_scores, hit_docs = [], []
+        for seg in self.segments:
+            scores = None
+            for term, weight in idf.items():
+                posting = seg.postings.get(term)
+                if posting is None:
+                    continue
+                docs, tf = posting
+                if scores is None:
+                    scores = np.zeros(len(seg), dtype=np.float64)
+                norm = tf + K1 * (1 - B + B * seg.lengths[docs] / avgdl)
+                scores[docs] += weight * tf * (K1 + 1) / norm
+            if scores is None:
+                continue
+            mask = scores > 0
+            if since is not None:
+                mask &= seg.ordinals >= _ordinal(since)
+            if until is not None:
+                mask &= seg.ordinals <= _ordinal(until)
+            if mode is not None:
+                mask &= seg.modes == mode
+            local = np.flatnonzero(mask)
+            hit_scores.append(scores[local])
+            hit_docs.append(local + seg.base)
+        if not hit_scores:
+            return [], 0
+        scores = np.concatenate(hit_scores)
+        docs = np.concatenate(hit_docs)
+        order = np.lexsort((-docs, -scores))
+        if top is not None:
+            order = order[:top]
+        bases = np.asarray([s.base for s in self.segments])
+        hits = []
+        for i in order:
+            seg = self.segments[int(np.searchsorted(bases, docs[i], side="right")) - 1]
+            hits.append((float(scores[i]), seg.notes[int(docs[i]) - seg.base]))
+        return hits, len(scores)
+
+
+def _summarize(notes):
+    return _Segment.build(0, notes).summary()
+
+
+def _build(query, summaries):
+    index = FullTextIndex()
+    for month, data in summaries:
+        index = index.with_segment(_Segment.from_summary(index.doc_count, month, data))
+    return index.added(query()[::-1])
+
+
+def _apply(index, notes):
+    if any(n.get("id") in index for n in notes):
+        return None
+    return index.added(notes)
+
+
+note_store.register_index(INDEX_NAME, _build, _apply, summarize=_summarize)
+
+
+def search(username, query, since=None, until=None, mode=None, offset=0, limit=10):
+    """
+    One page of BM25 results for ``query`` as ``(hits, total)``, where
+    ``hits`` is ``[(score, note)]``. ``since``/``until`` are inclusive
+    ``YYYY-MM-DD`` strings or dates.
+    """
+    if isinstance(since, date):
+        since = since.isoformat()
+    if isinstance(until, date):
+        until = until.isoformat()
+    ranked, total = note_store.derived(username, INDEX_NAME).search(
+        query, since, until, mode, top=offset + limit)
+    hits = []
+    for score, note in ranked[offset:]:
+        if isinstance(note, tuple):
+            note = note_store.archived_note(username, *note)
+        if note is not None:
+            hits.append((score, note))
+    return hits, total
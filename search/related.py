@@ -0,0 +1,118 @@
+"""
+Inverted index of diary entries for related-entry lookup.
+
+Maps each normalized term of a diary entry (words of ``raw_text_redacted``
+and its tags) to a posting list of ``(date ordinal, write seq, note)`` kept
+sorted, so the entries in a date window are a bisect away. It is a derived
+index of the note store: built once per user version and extended by every
+save, so no history is re-tokenized when a SOAP note asks for related entries.
+
+Lookups only look back a couple of weeks, so the index only holds the last
+``WINDOW_DAYS`` days: it is built from those (never touching the archived
+months) and drops older postings as saves move the window forward.
+"""
+import bisect
+from datetime import date, timedelta
+
+from search.text import normalize, tokens
+from storage import notes as note_store
+
+INDEX_NAME = "related"
+WINDOW_DAYS = 14
+
+
+def _window_start(today=None):
+    return ((today or date.today()) - timedelta(days=WINDOW_DAYS)).toordinal()
+
+
+class TermIndex:
+    __slots__ = ("postings", "ids", "seq", "start")
+
+    def __init__(self, start=0):
+        self.postings = {}  # term -> sorted [(ordinal, seq, note)]
+        self.ids = set()
+        self.seq = 0
+        self.start = start  # ordinal of the oldest date held
+
+    def pruned(self, start):
+        """A new index without the entries dated before ``start``."""
+        index = TermIndex(start)
+        index.seq = self.seq
+        for term, posting in self.postings.items():
+            kept = posting[bisect.bisect_left(posting, (start,)):]
+            if kept:
+                index.postings[term] = kept
+                index.ids.update(note["id"] for _, _, note in kept)
+        return index
+
+    def added(self, notes):
+        """A new index with ``notes`` added; only posting lists it touches are copied."""
+        index = TermIndex(self.start)
+        index.postings = dict(self.postings)
+        index.ids = set(self.ids)
+        index.seq = self.seq
+        copied = set()
+        for note in notes:
+            if note.get("mode") != "diary":
+                continue
+            try:
+                ordinal = date.fromisoformat(note.get("date", "")).toordinal()
+            except ValueError:
+                continue
+            if ordinal < index.start:
+                continue
+            index.seq += 1
+            index.ids.add(note["id"])
+            terms = set(tokens(note.get("raw_text_redacted", "")))
+            terms.update(normalize(t) for t in note.get("diary", {}).get("tags", []))
+            entry = (ordinal, index.seq, note)
+            for term in terms:
+                if term not in copied:
+                    index.postings[term] = list(index.postings.get(term, ()))
+                    copied.add(term)
+                posting = index.postings[term]
+                if not posting or posting[-1][:2] < entry[:2]:
+                    posting.append(entry)
+                else:
+                    # Backdated entry.
+                    posting.insert(bisect.bisect(posting, (ordinal, index.seq)), entry)
+        return index
+
+    def search(self, terms, since_ordinal, limit):
+        """Latest-written entries dated on or after ``since_ordinal`` that contain any of ``terms``."""
+        hits = {}
+        for term in terms:
+            posting = self.postings.get(normalize(term))
+            if not posting:
+                continue
+            for ordinal, seq, note in posting[bisect.bisect_left(posting, (since_ordinal,)):]:
+                hits[seq] = note
+        return [hits[seq] for seq in sorted(hits, reverse=True)[:limit]]
+
+
+def _build(query):
+    start = _window_start()
+    return TermIndex(start).added(query(mode="diary", since=date.fromordinal(start))[::-1])
+
+
+def _apply(index, notes):
+    if any(n.get("id") in index.ids for n in notes):
+        return None
+    start = _window_start()
+    if start > index.start:
+        index = index.pruned(start)
+    return index.added(notes)
+
+
+note_store.register_index(INDEX_NAME, _build, _apply)
+
+
+def related_entries(username, terms, days=14, limit=3, today=None):
+    """Up to ``limit`` diary entries from the last ``days`` days mentioning any of ``terms``, newest first."""
+    since = (today or date.today()) - timedelta(days=days)
+    index = note_store.derived(username, INDEX_NAME)
+    if since.toordinal() < index.start:
+        # Wider than the kept window: index just the requested days.
+        index = TermIndex(since.toordinal()).added(
+            note_store.query_notes(username, mode="diary", since=since))
+    return index.search(terms, since.toordinal(), limit)
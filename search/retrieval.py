@@ -0,0 +1,85 @@
+"""
+Retrieval of history entries for the assistant's prompt context.
+
+The freshest entries (the last SOAP note and the last few diary entries)
+are always considered first; the rest of the budget goes to the entries
+that rank best for the user's message under the BM25 full-text index, or to
+the next most recent entries when there is no message. Every line is costed
+against an explicit token budget, so prompt size stays bounded however long
+the history grows.
+"""
+import math
+
+from search import fulltext
+from search.text import tokens
+from storage import notes as note_store
+
+TOKEN_BUDGET = 400
+FRESH_DIARY = 3
+CANDIDATES = 20
+SNIPPET_CHARS = 240
+# A rough English average; close enough for budgeting without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def snippet(text, terms=(), width=SNIPPET_CHARS):
+    """At most ``width`` characters of ``text``, centred near the first of ``terms`` it contains."""
+    text = " ".join(str(text or "").split())
+    if len(text) <= width:
+        return text
+    lowered = text.lower()
+    start = 0
+    for term in terms:
+        pos = lowered.find(term)
+        if pos >= 0:
+            start = max(0, min(pos - width // 4, len(text) - width))
+            break
+    out = text[start:start + width]
+    return ("..." if start else "") + out + ("..." if start + width < len(text) else "")
+
+
+def entry_line(note, terms=()):
+    label = "SOAP" if note.get("mode") == "soap" else "Diary"
+    return f"- {note.get('date', 'Unknown Date')} {label}: {snippet(note.get('raw_text_redacted', ''), terms)}"
+
+
+def _candidates(username, query, modes):
+    """Fresh entries first, then ranked (or merely recent) ones, newest first within each group."""
+    if "soap" in modes:
+        yield from note_store.query_notes(username, mode="soap", limit=1, newest_first=True)
+    if "diary" in modes:
+        yield from note_store.query_notes(username, mode="diary", limit=FRESH_DIARY, newest_first=True)
+    mode = modes[0] if len(modes) == 1 else None
+    if tokens(query):
+        hits, _ = fulltext.search(username, query, mode=mode, limit=CANDIDATES)
+        yield from (note for _, note in hits)
+    else:
+        yield from note_store.query_notes(username, mode=mode, limit=CANDIDATES, newest_first=True)
+
+
+def context_lines(username, query="", use_soap=True, use_diary=True, budget=TOKEN_BUDGET):
+    """
+    Context lines for ``query`` that fit in ``budget`` tokens, oldest first.
+    Returns ``(lines, tokens_used)``.
+    """
+    modes = tuple(m for m, on in (("soap", use_soap), ("diary", use_diary)) if on)
+    if not modes or budget <= 0:
+        return [], 0
+    terms = tokens(query)
+    chosen, seen, used = [], set(), 0
+    for note in _candidates(username, query, modes):
+        if note.get("mode") not in modes or note.get("id") in seen:
+            continue
+        seen.add(note.get("id"))
+        line = entry_line(note, terms)
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            continue
+        chosen.append((note.get("date") or "", note.get("timestamp") or "", line))
+        used += cost
+    chosen.sort()
+    return [line for _, _, line in chosen], used
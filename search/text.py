@@ -0,0 +1,16 @@
+"""Text normalization shared by the search indexes."""
+import string
+
+_STRIP = string.punctuation + "“”‘’…"
+
+
+def normalize(term):
+    """Lowercases a term and trims surrounding punctuation ("Headache," -> "headache")."""
+    return term.lower().strip(_STRIP)
+
+
+def tokens(text):
+    """Whitespace tokens of ``text``, normalized; empty tokens are dropped."""
+    if not isinstance(text, str):
+        text = str(text or "")
+    return [t for t in (normalize(w) for w in text.split()) if t]
@@ -0,0 +1,21 @@
+"""
+Starts the Streamlit app with the NER model already loading.
+
+    python serve.py [streamlit run options]
+
+Streamlit only executes app_new.py when the first session connects, so a
+warm-up started from the script would still land on the first user. This
+starts it in the server process before Streamlit boots; the app imports the
+same, already-loaded module. With a shared NER worker running (see
+nlp.ner_worker) nothing is loaded here.
+"""
+import sys
+
+from streamlit.web import cli
+
+from nlp import ner, ner_worker
+
+if __name__ == "__main__":
+    if ner_worker.client() is None:
+        ner.warm_up()
+    cli.main(["run", "app_new.py", *sys.argv[1:]], prog_name="streamlit")
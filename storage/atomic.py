@@ -0,0 +1,78 @@
+"""
+Concurrency helpers shared by the storage engines.
+
+``locked(path)`` serializes writers of one file: a threading lock for the
+sessions inside this Streamlit process plus an advisory ``flock`` on a
+sibling ``.lock`` file for other processes. Locks are per file (one per user
+journal), never global. Whole-file rewrites go through ``atomic_write``, so
+readers only ever see the old or the new contents.
+"""
+import contextlib
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: only sessions inside this process are serialized.
+    fcntl = None
+
+
+class StaleVersionError(Exception):
+    """Raised when a write expected an older version of the store than the current one."""
+
+
+_registry_lock = threading.Lock()
+_thread_locks = {}
+
+
+def _thread_lock(path):
+    with _registry_lock:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.Lock()
+        return lock
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Exclusive lock for writers of ``path``. Not re-entrant."""
+    path = os.path.abspath(path)
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def atomic_write(path, data):
+    """Writes ``data`` (bytes or str) to a temp file and renames it over ``path``."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def file_version(path):
+    """Opaque version token of a file: changes on every append or replace."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
@@ -0,0 +1,491 @@
+"""
+Append-only per-user note journal.
+
+Every save appends one JSON record to ``data/users/<name>/notes.jsonl``.
+Updates to an existing note (e.g. a chat session that grows every turn) are
+written as a new version with the same ``id``; readers fold the journal into
+the latest view. Superseded versions are dropped by an occasional background
+compaction, so the cost of a save does not depend on the history length.
+
+Writers of one user's journal are serialized by a per-user lock
+(``storage.atomic.locked``); full rewrites use a temp file and rename.
+
+Only the last ``HOT_DAYS`` (rounded down to a month start) stay in the
+journal. Compaction moves older notes into read-only, gzip-compressed monthly
+archives (``archive/YYYY-MM.jsonl.gz``) described by ``archive/manifest.json``
+(per-month counts, modes and date range), so parsing the journal stays
+bounded. A note that is re-saved after it was archived lives in the journal
+again, and that copy wins over the archived one.
+
+Derived indexes may keep a summary of each archived month next to it
+(``archive/YYYY-MM.<index>.json``, see ``read_summary``), so rebuilding them
+does not decompress the archives; rewriting a month drops its summaries.
+"""
+import glob
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from storage.atomic import StaleVersionError, atomic_write, file_version, locked
+from storage.paths import user_data_dir
+
+JOURNAL_FILE = "notes.jsonl"
+LEGACY_FILE = "notes.json"
+
+# Compact once the journal holds at least this many lines and more than
+# COMPACT_RATIO lines per live note.
+COMPACT_MIN_LINES = 500
+COMPACT_RATIO = 2.0
+
+ARCHIVE_DIR = "archive"
+MANIFEST_FILE = "manifest.json"
+HOT_DAYS = 90
+STALE_TEMP_SECONDS = 600  # summary temp files older than this were abandoned
+
+_registry_lock = threading.Lock()
+_stats = {}          # username -> {"lines": int, "ids": set, "oldest": date str}
+_compacting = set()
+_manifests = {}      # username -> (file version, months)
+
+
+def journal_path(username):
+    return os.path.join(user_data_dir(username), JOURNAL_FILE)
+
+
+def _user_lock(username):
+    return locked(journal_path(username))
+
+
+def _encode(record):
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _fold(lines):
+    """
+    Folds journal lines into the latest version of every note, in write
+    order. Also returns the number of records and the ids deleted.
+    """
+    notes = {}
+    deleted = set()
+    count = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # A torn final line from an interrupted write; skip it.
+            continue
+        count += 1
+        if record.get("op") == "put":
+            note = record["note"]
+            notes.pop(note["id"], None)
+            notes[note["id"]] = note
+            deleted.discard(note["id"])
+        elif record.get("op") == "del":
+            notes.pop(record["id"], None)
+            deleted.add(record["id"])
+    return notes, count, deleted
+
+
+def _oldest_date(notes):
+    return min((n.get("date") or "" for n in notes if n.get("date")), default=None)
+
+
+def _migrate_legacy(username):
+    """Converts a legacy ``notes.json`` array into the journal, once."""
+    legacy = os.path.join(user_data_dir(username), LEGACY_FILE)
+    path = journal_path(username)
+    if os.path.exists(path) or not os.path.exists(legacy):
+        return
+    try:
+        with open(legacy, "r") as f:
+            notes = json.load(f)
+    except (OSError, ValueError):
+        notes = []
+    lines = []
+    for note in notes:
+        if isinstance(note, dict):
+            note.setdefault("id", uuid.uuid4().hex)
+            lines.append(_encode({"op": "put", "note": note}))
+    atomic_write(path, b"".join(lines))
+    os.replace(legacy, legacy + ".bak")
+
+
+def version(username):
+    """Identity of the journal's current contents, from a single stat call (0 if empty)."""
+    return file_version(journal_path(username)) or 0
+
+
+def read_notes(username):
+    """Returns the folded list of notes for a user."""
+    with _user_lock(username):
+        _migrate_legacy(username)
+    path = journal_path(username)
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        notes, lines, _ = _fold(f)
+    _stats[username] = {"lines": lines, "ids": set(notes), "oldest": _oldest_date(notes.values())}
+    maybe_compact(username)
+    return list(notes.values())
+
+
+def _reverse_lines(f, block_size=64 * 1024):
+    """Yields the file's non-empty lines last to first, reading fixed-size blocks from the end."""
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    partial = b""
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        lines = (f.read(step) + partial).split(b"\n")
+        # The first piece may continue in the previous block.
+        partial = lines.pop(0)
+        for line in reversed(lines):
+            if line.strip():
+                yield line
+    if partial.strip():
+        yield partial
+
+
+def tail_notes(username, limit=None, mode=None, since=None, until=None):
+    """
+    Latest notes matching the filters, newest first, read backwards from the
+    end of the journal so only the tail is parsed.
+    """
+    with _user_lock(username):
+        _migrate_legacy(username)
+    path = journal_path(username)
+    if not os.path.exists(path):
+        return []
+    seen = set()
+    out = []
+    with open(path, "rb") as f:
+        for line in _reverse_lines(f):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("op") == "del":
+                seen.add(record["id"])
+                continue
+            if record.get("op") != "put":
+                continue
+            note = record["note"]
+            if note["id"] in seen:
+                # An older, superseded version.
+                continue
+            seen.add(note["id"])
+            d = note.get("date") or ""
+            if mode is not None and note.get("mode") != mode:
+                continue
+            if (since is not None and d < since) or (until is not None and d > until):
+                continue
+            out.append(note)
+            if limit is not None and len(out) >= limit:
+                break
+    return out
+
+
+def write_notes(username, notes, expected_version=None):
+    """
+    Appends note versions to the journal in one write. Cost is independent
+    of history size. With ``expected_version``, raises StaleVersionError
+    instead of writing if the journal changed since that version was read.
+    Returns the journal versions before and after the write.
+    """
+    for note in notes:
+        note.setdefault("id", uuid.uuid4().hex)
+    path = journal_path(username)
+    with _user_lock(username):
+        _migrate_legacy(username)
+        before = version(username)
+        if expected_version is not None and before != expected_version:
+            raise StaleVersionError(username)
+        with open(path, "ab") as f:
+            f.write(b"".join(_encode({"op": "put", "note": note}) for note in notes))
+        after = version(username)
+        stats = _stats.get(username)
+        if stats is not None:
+            stats["lines"] += len(notes)
+            stats["ids"].update(note["id"] for note in notes)
+            stats["oldest"] = _oldest_date(notes + [{"date": stats["oldest"]}])
+    maybe_compact(username)
+    return before, after
+
+
+def write_note(username, note, expected_version=None):
+    return write_notes(username, [note], expected_version)
+
+
+def delete_notes(username, note_ids):
+    """Appends tombstones for ``note_ids``. Returns the versions before and after."""
+    path = journal_path(username)
+    with _user_lock(username):
+        _migrate_legacy(username)
+        before = version(username)
+        with open(path, "ab") as f:
+            f.write(b"".join(_encode({"op": "del", "id": note_id}) for note_id in note_ids))
+        after = version(username)
+        stats = _stats.get(username)
+        if stats is not None:
+            stats["lines"] += len(note_ids)
+            stats["ids"].difference_update(note_ids)
+    _drop_from_archive(username, note_ids)
+    maybe_compact(username)
+    return before, after
+
+
+def clear(username):
+    with _user_lock(username):
+        for name in (JOURNAL_FILE, LEGACY_FILE):
+            path = os.path.join(user_data_dir(username), name)
+            if os.path.exists(path):
+                os.remove(path)
+        with _archive_lock(username):
+            shutil.rmtree(archive_dir(username), ignore_errors=True)
+        _stats.pop(username, None)
+        _manifests.pop(username, None)
+
+
+# -----------------------------------------------------------------------------
+# Cold tier: monthly archives
+# -----------------------------------------------------------------------------
+def archive_cutoff(today=None):
+    """Notes dated before this ``YYYY-MM-DD`` (a month start) belong in the archives."""
+    boundary = (today or datetime.today()) - timedelta(days=HOT_DAYS)
+    return boundary.strftime("%Y-%m-01")
+
+
+def archive_dir(username):
+    return os.path.join(user_data_dir(username), ARCHIVE_DIR)
+
+
+def _archive_lock(username):
+    return locked(os.path.join(user_data_dir(username), MANIFEST_FILE))
+
+
+def _month_path(username, month):
+    return os.path.join(archive_dir(username), month + ".jsonl.gz")
+
+
+def read_manifest(username):
+    """
+    ``{"YYYY-MM": {"count", "modes", "first_date", "last_date", "rev"}}`` for
+    the archived months; cached against the manifest's file version.
+    """
+    path = os.path.join(archive_dir(username), MANIFEST_FILE)
+    current = file_version(path)
+    if current is None:
+        return {}
+    cached = _manifests.get(username)
+    if cached is not None and cached[0] == current:
+        return cached[1]
+    try:
+        with open(path, "r") as f:
+            months = json.load(f)
+    except (OSError, ValueError):
+        months = {}
+    _manifests[username] = (current, months)
+    return months
+
+
+def _summary_path(username, month, name):
+    return os.path.join(archive_dir(username), f"{month}.{name}.json")
+
+
+def read_summary(username, month, name):
+    """The summary index ``name`` stored for ``month`` with ``write_summary``, or None."""
+    try:
+        with open(_summary_path(username, month, name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_summary(username, month, name, summary):
+    atomic_write(_summary_path(username, month, name), json.dumps(summary, separators=(",", ":")))
+
+
+def read_archive(username, month):
+    """The notes archived for ``month``, in write order."""
+    try:
+        with gzip.open(_month_path(username, month), "rb") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def read_all_notes(username):
+    """Archived months followed by the journal; for exports, not the request path."""
+    hot = read_notes(username)
+    ids = {n["id"] for n in hot}
+    notes = []
+    for month in sorted(read_manifest(username)):
+        notes.extend(n for n in read_archive(username, month) if n["id"] not in ids)
+    return notes + hot
+
+
+def _write_month(username, month, notes, months):
+    # Summaries describe the month as it was; they are rebuilt from the new archive on demand.
+    for path in glob.glob(glob.escape(os.path.join(archive_dir(username), month)) + ".*.json"):
+        os.remove(path)
+    if not notes:
+        if os.path.exists(_month_path(username, month)):
+            os.remove(_month_path(username, month))
+        months.pop(month, None)
+        return
+    modes = {}
+    for note in notes:
+        modes[note.get("mode")] = modes.get(note.get("mode"), 0) + 1
+    dates = [n.get("date") for n in notes]
+    atomic_write(_month_path(username, month),
+                 gzip.compress(b"".join(json.dumps(n).encode("utf-8") + b"\n" for n in notes)))
+    months[month] = {
+        "count": len(notes),
+        "modes": modes,
+        "first_date": min(dates),
+        "last_date": max(dates),
+        "rev": months.get(month, {}).get("rev", 0) + 1,
+    }
+
+
+def _save_manifest(username, months):
+    atomic_write(os.path.join(archive_dir(username), MANIFEST_FILE), json.dumps(months, indent=2))
+
+
+def _archive_notes(username, notes):
+    """Merges ``notes`` into their month archives; a newer copy of an id replaces the old one."""
+    by_month = {}
+    for note in notes:
+        by_month.setdefault(note["date"][:7], []).append(note)
+    with _archive_lock(username):
+        os.makedirs(archive_dir(username), exist_ok=True)
+        months = dict(read_manifest(username))
+        for month, new in by_month.items():
+            ids = {n["id"] for n in new}
+            existing = [n for n in read_archive(username, month) if n["id"] not in ids]
+            _write_month(username, month, existing + new, months)
+        _save_manifest(username, months)
+
+
+def _drop_from_archive(username, note_ids):
+    """Removes deleted notes from the archives. Deletes are rare, so this just scans them."""
+    ids = set(note_ids)
+    with _archive_lock(username):
+        months = dict(read_manifest(username))
+        if not months:
+            return
+        for month in list(months):
+            notes = read_archive(username, month)
+            kept = [n for n in notes if n["id"] not in ids]
+            if len(kept) != len(notes):
+                _write_month(username, month, kept, months)
+        _save_manifest(username, months)
+
+
+def compact(username):
+    """
+    Rewrites the journal keeping only the latest version of each note, and
+    moves notes older than ``archive_cutoff()`` into the monthly archives.
+    """
+    # One compaction per journal at a time, across processes too.
+    with locked(journal_path(username) + ".compact"):
+        _compact(username)
+
+
+def _remove_stale_temps(username):
+    """
+    Deletes temp files left by a process that exited mid-write; compaction
+    runs in a daemon thread, so exiting can cut it short. Called with the
+    compaction lock held, so no other compaction can be writing them.
+    """
+    leftover = journal_path(username) + ".compact"
+    if os.path.exists(leftover):
+        os.remove(leftover)
+    prefix = glob.escape(archive_dir(username)) + os.sep
+    with _archive_lock(username):
+        # Archive and manifest writes only happen under this lock.
+        for path in glob.glob(prefix + "*.jsonl.gz.*.tmp") + glob.glob(prefix + MANIFEST_FILE + ".*.tmp"):
+            os.remove(path)
+    # Summaries are written by readers without a lock; only old temps are abandoned.
+    cutoff = time.time() - STALE_TEMP_SECONDS
+    for path in glob.glob(prefix + "*.json.*.tmp"):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _compact(username):
+    path = journal_path(username)
+    _remove_stale_temps(username)
+    with _user_lock(username):
+        if not os.path.exists(path):
+            return
+        snapshot = os.path.getsize(path)
+
+    # Fold the snapshot without blocking writers; they only ever append.
+    with open(path, "rb") as f:
+        notes, _, _ = _fold(f.read(snapshot).splitlines())
+    cutoff = archive_cutoff()
+    cold = [n for n in notes.values() if n.get("date") and n["date"] < cutoff]
+    for note in cold:
+        del notes[note["id"]]
+    tmp = path + ".compact"
+    with open(tmp, "wb") as out:
+        for note in notes.values():
+            out.write(_encode({"op": "put", "note": note}))
+
+    with _user_lock(username):
+        if not os.path.exists(path) or os.path.getsize(path) < snapshot:
+            # Cleared or rewritten underneath us; our snapshot is stale.
+            os.remove(tmp)
+            return
+        # Carry over anything appended while we were folding.
+        with open(path, "rb") as f, open(tmp, "ab") as out:
+            f.seek(snapshot)
+            tail = f.read()
+            out.write(tail)
+        tail_notes, tail_lines, tail_deleted = _fold(tail.splitlines())
+        cold = [n for n in cold if n["id"] not in tail_deleted]
+        if cold:
+            # Archived before the journal drops them: a crash in between
+            # leaves a duplicate that readers resolve in favour of the journal.
+            _archive_notes(username, cold)
+        os.replace(tmp, path)
+        ids = set(notes) | set(tail_notes)
+        _stats[username] = {"lines": len(notes) + tail_lines, "ids": ids,
+                            "oldest": _oldest_date(list(notes.values()) + list(tail_notes.values()))}
+
+
+def _compact_worker(username):
+    try:
+        compact(username)
+    finally:
+        with _registry_lock:
+            _compacting.discard(username)
+
+
+def maybe_compact(username):
+    """Schedules a background compaction when superseded versions pile up or notes went cold."""
+    stats = _stats.get(username)
+    if not stats:
+        return
+    has_cold = stats["oldest"] is not None and stats["oldest"] < archive_cutoff()
+    if not has_cold and (stats["lines"] < COMPACT_MIN_LINES
+                         or stats["lines"] <= COMPACT_RATIO * max(len(stats["ids"]), 1)):
+        return
+    with _registry_lock:
+        if username in _compacting:
+            return
+        _compacting.add(username)
+    threading.Thread(target=_compact_worker, args=(username,), daemon=True).start()
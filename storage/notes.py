@@ -0,0 +1,466 @@
+"""
+Note storage facade.
+
+The engine is picked with the ``STORAGE_BACKEND`` environment variable:
+``jsonl`` (default, per-user append-only journal) or ``sqlite``.
+
+Parsed histories are cached per user and validated against the engine's
+cheap version token (a stat of the journal, or a counter row in SQLite), so
+repeated ``load_notes`` calls within a rerun only parse the history once,
+and not at all when nothing changed since the last rerun. Saves through this
+module update the cached list in place instead of invalidating it.
+
+Most pages only need a slice of the history; ``query_notes`` pushes the
+mode/date/limit predicates down to the engine (SQL for SQLite, per-mode
+views of the cached snapshot for the journal).
+
+Every engine exposes an opaque per-user version. ``save_notes`` accepts an
+``expected_version`` and raises ``StaleVersionError`` when the store moved
+on, so a batch job (nlp.backfill) can re-read and retry instead of
+overwriting a newer edit.
+
+With the journal engine the cached snapshot only holds the hot tier; months
+that compaction moved into compressed archives are opened lazily, when a
+query reaches past the hot tier, and a few parsed months are kept in an LRU.
+
+Derived per-user structures (trend windows, rollups, search indexes) are
+registered with ``register_index`` and hang off the cached snapshot: built
+once per version and carried forward incrementally by every save. Indexes
+that cover the whole history can also give a ``summarize`` function; their
+per-month summaries are stored next to the archives, so a rebuild reads
+those and folds in only the hot tier instead of decompressing every month.
+
+``submit_note`` hands saves to a background write-behind queue
+(``WRITE_BEHIND=0`` disables it). Every read in this module overlays the
+queued notes, so a session always sees its own writes.
+"""
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date
+
+from storage import journal, sqlite_backend, write_behind
+
+UPDATE_ATTEMPTS = 5
+ARCHIVE_CACHE_MONTHS = 12
+
+_registry_lock = threading.Lock()
+_user_locks = {}
+_cache = {}  # username -> _Snapshot
+_ALL = "*"   # key of the full-history view in _Snapshot.ordered
+_archive_cache = OrderedDict()  # (username, month) -> (manifest entry, notes)
+_indexes = {}   # name -> (build, apply, summarize, summary_version)
+_summary_cache = {}  # (username, month, index name) -> (manifest entry, ids, summary)
+
+
+class _Snapshot:
+    """A parsed history plus per-mode views, replaced copy-on-write on save."""
+
+    __slots__ = ("version", "notes", "by_mode", "ordered", "derived", "_by_id")
+
+    def __init__(self, version, notes):
+        self.version = version
+        self.notes = []
+        self.by_mode = {}
+        self.derived = {}  # index name -> state, see register_index
+        self._by_id = None
+        # Whether a view's dates are non-decreasing, which lets date-bounded
+        # scans stop early. True for everything written through the app.
+        self.ordered = {}
+        for note in notes:
+            self._append(note, self.by_mode.setdefault(note.get("mode"), []))
+
+    def _append(self, note, mode_view):
+        d = note.get("date") or ""
+        for key, view in ((_ALL, self.notes), (note.get("mode"), mode_view)):
+            ordered = self.ordered.get(key, True)
+            if view and (view[-1].get("date") or "") > d:
+                ordered = False
+            self.ordered[key] = ordered
+            view.append(note)
+
+    def with_notes(self, version, notes, removed=()):
+        snap = _Snapshot.__new__(_Snapshot)
+        snap.version = version
+        snap.derived = {}
+        snap._by_id = None
+        if not removed:
+            for name, state in self.derived.items():
+                state = _indexes[name][1](state, notes)
+                if state is not None:
+                    snap.derived[name] = state
+        snap.ordered = dict(self.ordered)
+        snap.by_mode = dict(self.by_mode)
+        ids = {note["id"] for note in notes} | set(removed)
+        snap.notes = [n for n in self.notes if n.get("id") not in ids]
+        if len(snap.notes) != len(self.notes):
+            # Updates and deletes: drop the previous versions from their mode views too.
+            for mode, view in snap.by_mode.items():
+                snap.by_mode[mode] = [n for n in view if n.get("id") not in ids]
+        copied = set()
+        for note in notes:
+            mode = note.get("mode")
+            if mode not in copied:
+                snap.by_mode[mode] = list(snap.by_mode.get(mode, []))
+                copied.add(mode)
+            snap._append(note, snap.by_mode[mode])
+        return snap
+
+    def holds(self, note):
+        """Whether this exact version of ``note`` is already in the snapshot."""
+        if self._by_id is None:
+            self._by_id = {n.get("id"): n for n in self.notes}
+        held = self._by_id.get(note.get("id"))
+        return held is note or (held is not None and held == note)
+
+    def query(self, mode, since, until, limit):
+        view = self.notes if mode is None else self.by_mode.get(mode, [])
+        ordered = self.ordered.get(_ALL if mode is None else mode, True)
+        out = []
+        for note in reversed(view):
+            d = note.get("date") or ""
+            if until is not None and d > until:
+                continue
+            if since is not None and d < since:
+                if ordered:
+                    break
+                continue
+            out.append(note)
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+
+def backend():
+    if sqlite_backend.enabled():
+        return sqlite_backend
+    return journal
+
+
+def _user_lock(username):
+    with _registry_lock:
+        lock = _user_locks.get(username)
+        if lock is None:
+            lock = _user_locks[username] = threading.Lock()
+        return lock
+
+
+def _snapshot(username):
+    store = backend()
+    current = store.version(username)
+    snap = _cache.get(username)
+    if snap is not None and snap.version == current:
+        return snap
+    # Versioned with the token taken before reading: a write that races the
+    # read just makes the next call re-read.
+    snap = _cache[username] = _Snapshot(current, store.read_notes(username))
+    return snap
+
+
+def _snapshot_is_current(username):
+    snap = _cache.get(username)
+    return snap is not None and snap.version == backend().version(username)
+
+
+def notes_version(username):
+    return backend().version(username)
+
+
+# -----------------------------------------------------------------------------
+# Archived months (journal engine only)
+# -----------------------------------------------------------------------------
+def _archived_months(username):
+    if backend() is not journal:
+        return {}
+    return journal.read_manifest(username)
+
+
+def _archived(username, month, entry):
+    key = (username, month)
+    with _registry_lock:
+        cached = _archive_cache.get(key)
+        if cached is not None and cached[0] == entry:
+            _archive_cache.move_to_end(key)
+            return cached[1]
+    notes = journal.read_archive(username, month)
+    with _registry_lock:
+        _archive_cache[key] = (entry, notes)
+        while len(_archive_cache) > ARCHIVE_CACHE_MONTHS:
+            _archive_cache.popitem(last=False)
+    return notes
+
+
+def _archive_query(username, mode, since, until, limit, exclude):
+    """Newest-first matches from the archived months; ``exclude`` holds ids the hot tier supersedes."""
+    out = []
+    months = _archived_months(username)
+    for month in sorted(months, reverse=True):
+        entry = months[month]
+        if since is not None and entry["last_date"] < since:
+            continue
+        if until is not None and entry["first_date"] > until:
+            continue
+        if mode is not None and not entry["modes"].get(mode):
+            continue
+        for note in reversed(_archived(username, month, entry)):
+            if note["id"] in exclude or not _matches(note, mode, since, until):
+                continue
+            out.append(note)
+            if limit is not None and len(out) >= limit:
+                return out
+    return out
+
+
+def _hot_ids(username):
+    return {n.get("id") for n in _snapshot(username).notes}
+
+
+def load_notes(username):
+    """
+    Returns the user's full history, archived months included. Prefer
+    ``query_notes``; treat the list as read-only, it may be shared with the cache.
+    """
+    notes = _snapshot(username).notes
+    if _archived_months(username):
+        notes = _archive_query(username, None, None, None, None, _hot_ids(username))[::-1] + notes
+    pending = _writer.pending(username)
+    if not pending:
+        return notes
+    ids = {n["id"] for n in pending}
+    return [n for n in notes if n.get("id") not in ids] + pending
+
+
+def _date_key(value):
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def _matches(note, mode, since, until):
+    d = note.get("date") or ""
+    return ((mode is None or note.get("mode") == mode)
+            and (since is None or d >= since) and (until is None or d <= until))
+
+
+def _stored_query(username, mode, since, until, limit):
+    """Newest-first matches from the engine, ignoring queued writes."""
+    store = backend()
+    if _snapshot_is_current(username):
+        notes = _cache[username].query(mode, since, until, limit)
+    elif store is sqlite_backend:
+        return sqlite_backend.query_notes(username, mode, since, until, limit)
+    elif limit is not None:
+        # "Recent" views only parse the journal's tail, so their cost does not
+        # grow with the history.
+        notes = journal.tail_notes(username, limit, mode, since, until)
+    else:
+        notes = _snapshot(username).query(mode, since, until, limit)
+    if (limit is None or len(notes) < limit) and _archived_months(username):
+        notes = notes + _archive_query(username, mode, since, until,
+                                       None if limit is None else limit - len(notes),
+                                       _hot_ids(username))
+    return notes
+
+
+def query_notes(username, mode=None, since=None, until=None, limit=None, newest_first=False):
+    """
+    Notes matching ``mode`` with ``since <= date <= until`` (inclusive,
+    ``YYYY-MM-DD`` strings or dates). ``limit`` keeps the most recent matches,
+    like ``notes[-limit:]``; results are oldest-first unless ``newest_first``.
+    """
+    since, until = _date_key(since), _date_key(until)
+    pending = _writer.pending(username)
+    if not pending:
+        notes = _stored_query(username, mode, since, until, limit)
+    else:
+        ids = {n["id"] for n in pending}
+        stored = _stored_query(username, mode, since, until,
+                               None if limit is None else limit + len(pending))
+        notes = [n for n in reversed(pending) if _matches(n, mode, since, until)]
+        notes += [n for n in stored if n.get("id") not in ids]
+        if limit is not None:
+            notes = notes[:limit]
+    return notes if newest_first else notes[::-1]
+
+
+def save_notes(username, notes, expected_version=None):
+    """Writes notes synchronously, in one batch."""
+    store = backend()
+    with _user_lock(username):
+        before, after = store.write_notes(username, notes, expected_version)
+        snap = _cache.get(username)
+        if snap is not None and snap.version == before:
+            _cache[username] = snap.with_notes(after, notes)
+        else:
+            _cache.pop(username, None)
+    return notes
+
+
+def save_note(username, note, expected_version=None):
+    save_notes(username, [note], expected_version)
+    return note
+
+
+def delete_notes(username, note_ids):
+    """Removes notes by id (synchronously; queued saves of them are flushed first)."""
+    if not note_ids:
+        return
+    _writer.flush()
+    with _user_lock(username):
+        before, after = backend().delete_notes(username, note_ids)
+        snap = _cache.get(username)
+        if snap is not None and snap.version == before:
+            _cache[username] = snap.with_notes(after, [], removed=note_ids)
+        else:
+            _cache.pop(username, None)
+
+
+# -----------------------------------------------------------------------------
+# Derived indexes
+# -----------------------------------------------------------------------------
+def register_index(name, build, apply, summarize=None, summary_version=1):
+    """
+    Registers a derived per-user structure.
+
+    ``build(query)`` computes it from scratch; ``query(mode=None, since=None,
+    until=None, limit=None)`` returns matching notes newest first.
+    ``apply(state, notes)`` returns the state after ``notes`` were saved, in
+    order, without mutating ``state``; it may return None to ask for a rebuild
+    (e.g. when a note it already holds was edited).
+
+    With ``summarize``, the build is ``build(query, summaries)`` instead:
+    ``summaries`` is ``[(month, summarize(notes of that month))]`` for the
+    archived months, oldest first, and ``query`` only returns the notes
+    outside them. Summaries must be JSON (lists, dicts with str keys); they
+    are stored with the archives and recomputed when a month is rewritten or
+    ``summary_version`` changes, so a rebuild never decompresses old months.
+    """
+    _indexes[name] = (build, apply, summarize, summary_version)
+
+
+def _month_summary(username, name, month, entry):
+    """``(ids, summary)`` of one archived month for index ``name``; computed and stored once."""
+    summarize, summary_version = _indexes[name][2:]
+    key = (username, month, name)
+    cached = _summary_cache.get(key)
+    if cached is not None and cached[0] == entry:
+        return cached[1], cached[2]
+    stored = journal.read_summary(username, month, name)
+    if stored is None or stored.get("entry") != entry or stored.get("version") != summary_version:
+        notes = _archived(username, month, entry)
+        # Round-tripped, so a fresh summary looks exactly like a stored one.
+        stored = json.loads(json.dumps({"entry": entry, "version": summary_version,
+                                        "ids": [n["id"] for n in notes], "summary": summarize(notes)}))
+        journal.write_summary(username, month, name, stored)
+    ids = frozenset(stored["ids"])
+    with _registry_lock:
+        _summary_cache[key] = (entry, ids, stored["summary"])
+    return ids, stored["summary"]
+
+
+def _summaries(username, name, exclude):
+    """The archived months' summaries for index ``name``, leaving out the ids in ``exclude``."""
+    summarize = _indexes[name][2]
+    months = _archived_months(username)
+    out = []
+    for month in sorted(months):
+        ids, summary = _month_summary(username, name, month, months[month])
+        if not exclude.isdisjoint(ids):
+            # Some of the month's notes were re-saved since; those copies come from ``query``.
+            notes = [n for n in _archived(username, month, months[month]) if n["id"] not in exclude]
+            if not notes:
+                continue
+            summary = json.loads(json.dumps(summarize(notes)))
+        out.append((month, summary))
+    return out
+
+
+def archived_note(username, month, note_id):
+    """The archived copy of ``note_id`` from ``month``, for indexes built from summaries."""
+    months = _archived_months(username)
+    if month not in months:
+        return None
+    for note in _archived(username, month, months[month]):
+        if note["id"] == note_id:
+            return note
+    return None
+
+
+def _build_index(username, name, snap, overlay):
+    build, _, summarize, _ = _indexes[name]
+    if summarize is None:
+        def query(mode=None, since=None, until=None, limit=None):
+            if overlay:
+                return query_notes(username, mode, since, until, limit, newest_first=True)
+            return _stored_query(username, mode, _date_key(since), _date_key(until), limit)
+        return build(query)
+
+    # The hot tier comes from ``snap`` and the summaries from the manifest
+    # read after it. Compaction archives notes before it drops them from the
+    # journal, so a concurrent compaction cannot make a note go missing.
+    pending = _writer.pending(username) if overlay else []
+    ids = {n["id"] for n in pending}
+
+    def hot(mode=None, since=None, until=None, limit=None):
+        since, until = _date_key(since), _date_key(until)
+        notes = [n for n in reversed(pending) if _matches(n, mode, since, until)]
+        notes += [n for n in snap.query(mode, since, until, None if limit is None else limit + len(pending))
+                  if n.get("id") not in ids]
+        return notes if limit is None else notes[:limit]
+
+    exclude = ids | {n.get("id") for n in snap.notes}
+    return build(hot, _summaries(username, name, exclude))
+
+
+def derived(username, name):
+    """The current state of index ``name`` for a user, queued saves included."""
+    apply = _indexes[name][1]
+    snap = _snapshot(username)
+    state = snap.derived.get(name)
+    if state is None:
+        state = snap.derived[name] = _build_index(username, name, snap, overlay=False)
+    # Saves in flight may already be in the snapshot; applying them again
+    # would look like an edit and force a full rebuild.
+    pending = [n for n in _writer.pending(username) if not snap.holds(n)]
+    if pending:
+        state = apply(state, pending)
+        if state is None:
+            state = _build_index(username, name, snap, overlay=True)
+    return state
+
+
+# -----------------------------------------------------------------------------
+# Write-behind saves (the UI thread never waits on disk)
+# -----------------------------------------------------------------------------
+_writer = write_behind.WriteBehindQueue(save_notes)
+
+
+def write_behind_enabled():
+    return os.getenv("WRITE_BEHIND", "1") != "0"
+
+
+def submit_note(username, note):
+    """Queues a save for the background writer; falls back to save_note when disabled."""
+    note.setdefault("id", uuid.uuid4().hex)
+    if not write_behind_enabled():
+        return save_note(username, note)
+    return _writer.submit(username, note)
+
+
+def flush_writes():
+    _writer.flush()
+
+
+def clear_notes(username):
+    _writer.discard(username)
+    _writer.flush()
+    with _user_lock(username):
+        backend().clear(username)
+        _cache.pop(username, None)
+    with _registry_lock:
+        for key in [k for k in _archive_cache if k[0] == username]:
+            del _archive_cache[key]
+        for key in [k for k in _summary_cache if k[0] == username]:
+            del _summary_cache[key]
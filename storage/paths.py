@@ -0,0 +1,14 @@
+import os
+
+DATA_DIR = "data"
+
+
+def safe_username(username):
+    """Sanitize username (allow only letters, numbers, underscore)."""
+    return "".join([c for c in username if c.isalnum() or c == '_'])
+
+
+def user_data_dir(username):
+    path = os.path.join(DATA_DIR, "users", safe_username(username))
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,202 @@
+"""
+Chat session store, kept apart from the diary/SOAP notes.
+
+Each session is an append-only message log plus one entry in a small
+per-user index (id -> title, timestamp, date, message count), so listing
+sessions never touches messages and a turn only writes its new messages.
+Follows the same ``STORAGE_BACKEND`` switch as the notes: with the file
+engine, messages go to ``data/users/<name>/sessions/<id>.jsonl`` and the
+index to ``sessions/index.json``; with SQLite, to the ``chat_sessions`` and
+``chat_messages`` tables.
+
+Appends go through a write-behind queue like the notes; queued appends to
+the same session fold into one write, and reads overlay them. Each queued
+delta records the message position it starts at, so a reader that sees it
+both in storage and in the queue (it landed mid-read) counts it once.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+
+from storage import notes as note_store
+from storage import sqlite_backend, write_behind
+from storage.atomic import atomic_write, locked
+from storage.paths import user_data_dir
+
+SESSIONS_DIR = "sessions"
+INDEX_FILE = "index.json"
+
+_migrated = set()
+
+
+def sessions_dir(username):
+    path = os.path.join(user_data_dir(username), SESSIONS_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _index_path(username):
+    return os.path.join(sessions_dir(username), INDEX_FILE)
+
+
+def _messages_path(username, session_id):
+    safe_id = "".join(c for c in session_id if c.isalnum() or c in "-_")
+    return os.path.join(sessions_dir(username), safe_id + ".jsonl")
+
+
+def _read_index(username):
+    try:
+        with open(_index_path(username), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _append_json(username, entries):
+    path = _index_path(username)
+    with locked(path):
+        index = _read_index(username)
+        for entry in entries:
+            current = index.get(entry["id"], {"count": 0, "bytes": 0})
+            data = b"".join((json.dumps(m, separators=(",", ":")) + "\n").encode("utf-8")
+                            for m in entry["messages"])
+            with open(_messages_path(username, entry["id"]), "ab") as f:
+                # Drop anything past the indexed size: the remains of a write
+                # that failed before the index was updated.
+                f.truncate(current["bytes"])
+                f.write(data)
+            index[entry["id"]] = {
+                "id": entry["id"],
+                "title": entry.get("title"),
+                "timestamp": entry.get("timestamp"),
+                "date": entry.get("date"),
+                "count": current["count"] + len(entry["messages"]),
+                "bytes": current["bytes"] + len(data),
+            }
+        atomic_write(path, json.dumps(index))
+
+
+def _load_json_messages(username, session_id):
+    entry = _read_index(username).get(session_id)
+    if entry is None:
+        return []
+    with open(_messages_path(username, session_id), "rb") as f:
+        data = f.read(entry["bytes"])
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+
+def read_json_sessions(username):
+    """Every session in the file engine with its messages, for the SQLite import."""
+    return [dict(entry, messages=_load_json_messages(username, entry["id"]))
+            for entry in _read_index(username).values()]
+
+
+def _persist(username, entries):
+    if sqlite_backend.enabled():
+        sqlite_backend.append_session_messages(username, entries)
+    else:
+        _append_json(username, entries)
+
+
+def _stored_sessions(username):
+    if sqlite_backend.enabled():
+        return sqlite_backend.list_sessions(username)
+    return list(_read_index(username).values())
+
+
+def _stored_messages(username, session_id):
+    if sqlite_backend.enabled():
+        return sqlite_backend.load_messages(username, session_id)
+    return _load_json_messages(username, session_id)
+
+
+def _migrate_notes(username):
+    """Moves sessions saved as ``chat_session`` notes into this store, once per process."""
+    if username in _migrated:
+        return
+    legacy = note_store.query_notes(username, mode="chat_session")
+    if legacy:
+        known = {s["id"] for s in _stored_sessions(username)}
+        entries = [{"id": n["id"], "title": n.get("title"), "timestamp": n.get("timestamp"),
+                    "date": n.get("date"), "messages": n.get("messages", [])}
+                   for n in legacy if n["id"] not in known]
+        if entries:
+            _persist(username, entries)
+        note_store.delete_notes(username, [n["id"] for n in legacy])
+    _migrated.add(username)
+
+
+def _stored_count(username, session_id):
+    for session in _stored_sessions(username):
+        if session["id"] == session_id:
+            return session["count"]
+    return 0
+
+
+def _merge_deltas(older, newer):
+    """One delta: ``older``'s messages then ``newer``'s, with ``newer``'s title and time."""
+    return dict(newer, start=older["start"], messages=older["messages"] + newer["messages"])
+
+
+_writer = write_behind.WriteBehindQueue(_persist, merge=_merge_deltas)
+
+
+def append_messages(username, session_id, messages, title):
+    """Appends ``messages`` to a session (creating it) and sets its title."""
+    _migrate_notes(username)
+    now = datetime.now()
+    entry = {
+        "id": session_id,
+        "title": title,
+        "timestamp": now.isoformat(),
+        "date": now.strftime("%Y-%m-%d"),
+        "messages": list(messages),
+    }
+    if not note_store.write_behind_enabled():
+        _persist(username, [entry])
+        return
+
+    def positioned(queued):
+        # Starts where the newest queued delta ends, or after what is stored.
+        entry["start"] = queued["start"] + len(queued["messages"])
+        return entry
+
+    _writer.update(username, session_id, positioned,
+                   lambda: {"start": _stored_count(username, session_id), "messages": []})
+
+
+def list_sessions(username):
+    """Index entries (``id``, ``title``, ``timestamp``, ``date``, ``count``), newest first."""
+    _migrate_notes(username)
+    # The queue first: a delta that lands in between is then seen twice
+    # (and counted once) rather than not at all.
+    queued = _writer.queued(username)
+    index = {s["id"]: s for s in _stored_sessions(username)}
+    for entry in queued:
+        session = dict(index.get(entry["id"], {"count": 0}))
+        session.update({k: entry[k] for k in ("id", "title", "timestamp", "date")})
+        session["count"] = max(session["count"], entry["start"] + len(entry["messages"]))
+        index[entry["id"]] = session
+    return sorted(index.values(), key=lambda s: s.get("timestamp") or "", reverse=True)
+
+
+def load_messages(username, session_id):
+    _migrate_notes(username)
+    queued = _writer.queued(username)  # before the stored ones, as in list_sessions
+    messages = _stored_messages(username, session_id)
+    for entry in queued:
+        if entry["id"] == session_id:
+            # Skips whatever part of the delta is already stored.
+            messages += entry["messages"][max(0, len(messages) - entry["start"]):]
+    return messages
+
+
+def clear_sessions(username):
+    _writer.discard(username)
+    _writer.flush()
+    if sqlite_backend.enabled():
+        sqlite_backend.clear_sessions(username)
+    else:
+        with locked(_index_path(username)):
+            shutil.rmtree(sessions_dir(username), ignore_errors=True)
@@ -0,0 +1,310 @@
+"""
+SQLite storage engine for notes and users (``data/health_assistant.db``).
+
+Each note is one row keyed by (user, id) with the full note kept as a JSON
+payload; the columns we filter on are denormalized next to it and indexed.
+The database runs in WAL mode so page loads can read while a save commits.
+"""
+import glob
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from storage.atomic import StaleVersionError
+from storage.paths import DATA_DIR
+
+DB_PATH = os.path.join(DATA_DIR, "health_assistant.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL,
+    created_at TEXT,
+    role TEXT DEFAULT 'patient',
+    payload TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS notes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    id TEXT NOT NULL,
+    timestamp TEXT,
+    date TEXT,
+    mode TEXT,
+    payload TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notes_user_id ON notes(user, id);
+CREATE INDEX IF NOT EXISTS idx_notes_user_date ON notes(user, date);
+CREATE INDEX IF NOT EXISTS idx_notes_user_mode ON notes(user, mode);
+CREATE TABLE IF NOT EXISTS note_versions (
+    user TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    user TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    timestamp TEXT,
+    date TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, id)
+);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    user TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (user, session_id, seq)
+);
+"""
+
+_local = threading.local()
+
+
+def enabled():
+    """True when ``STORAGE_BACKEND=sqlite`` selects this engine."""
+    return os.getenv("STORAGE_BACKEND", "jsonl").lower() == "sqlite"
+
+
+def connect():
+    """Returns this thread's connection, creating the schema on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+        if "role" not in columns:
+            # Databases created before the column existed (see migrate_db.py).
+            conn.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'patient'")
+        _local.conn = conn
+    return conn
+
+
+# -----------------------------------------------------------------------------
+# Notes
+# -----------------------------------------------------------------------------
+def _note_row(username, note):
+    return (username, note["id"], note.get("timestamp"), note.get("date"),
+            note.get("mode"), json.dumps(note))
+
+
+def _bump_version(conn, username):
+    conn.execute(
+        "INSERT INTO note_versions (user, version) VALUES (?, 1) "
+        "ON CONFLICT(user) DO UPDATE SET version = version + 1", (username,))
+
+
+def _current_version(conn, username):
+    row = conn.execute(
+        "SELECT version FROM note_versions WHERE user = ?", (username,)).fetchone()
+    return row[0] if row else 0
+
+
+def version(username):
+    """Per-user counter bumped in the same transaction as every write."""
+    return _current_version(connect(), username)
+
+
+def read_notes(username):
+    rows = connect().execute(
+        "SELECT payload FROM notes WHERE user = ? ORDER BY seq", (username,))
+    return [json.loads(payload) for (payload,) in rows]
+
+
+def query_notes(username, mode=None, since=None, until=None, limit=None):
+    """Matching notes, newest first, answered from the (user, mode)/(user, date) indexes."""
+    sql = "SELECT payload FROM notes WHERE user = ?"
+    args = [username]
+    if mode is not None:
+        sql += " AND mode = ?"
+        args.append(mode)
+    if since is not None:
+        sql += " AND date >= ?"
+        args.append(since)
+    if until is not None:
+        sql += " AND date <= ?"
+        args.append(until)
+    sql += " ORDER BY seq DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        args.append(limit)
+    return [json.loads(payload) for (payload,) in connect().execute(sql, args)]
+
+
+def write_notes(username, notes, expected_version=None):
+    """
+    Inserts notes, replacing stored versions with the same id, in one
+    transaction. With ``expected_version``, raises StaleVersionError if the
+    user's notes changed since then. Returns the versions before and after.
+    """
+    for note in notes:
+        note.setdefault("id", uuid.uuid4().hex)
+    conn = connect()
+    with conn:
+        # Take the write lock up front so the version check and the write
+        # are one atomic step.
+        conn.execute("BEGIN IMMEDIATE")
+        before = _current_version(conn, username)
+        if expected_version is not None and before != expected_version:
+            raise StaleVersionError(username)
+        # REPLACE deletes the old row, so an updated note moves to the end of
+        # the history just like a new version in the JSONL journal.
+        conn.executemany(
+            "INSERT OR REPLACE INTO notes (user, id, timestamp, date, mode, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?)", [_note_row(username, note) for note in notes])
+        _bump_version(conn, username)
+    return before, before + 1
+
+
+def write_note(username, note, expected_version=None):
+    return write_notes(username, [note], expected_version)
+
+
+def delete_notes(username, note_ids):
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        before = _current_version(conn, username)
+        conn.executemany("DELETE FROM notes WHERE user = ? AND id = ?",
+                         [(username, note_id) for note_id in note_ids])
+        _bump_version(conn, username)
+    return before, before + 1
+
+
+def clear(username):
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM notes WHERE user = ?", (username,))
+        _bump_version(conn, username)
+
+
+# -----------------------------------------------------------------------------
+# Chat sessions
+# -----------------------------------------------------------------------------
+def list_sessions(username):
+    rows = connect().execute(
+        "SELECT id, title, timestamp, date, message_count FROM chat_sessions "
+        "WHERE user = ? ORDER BY timestamp DESC", (username,))
+    return [{"id": sid, "title": title, "timestamp": timestamp, "date": d, "count": count}
+            for sid, title, timestamp, d, count in rows]
+
+
+def load_messages(username, session_id):
+    rows = connect().execute(
+        "SELECT payload FROM chat_messages WHERE user = ? AND session_id = ? ORDER BY seq",
+        (username, session_id))
+    return [json.loads(payload) for (payload,) in rows]
+
+
+def append_session_messages(username, entries):
+    """Appends each entry's messages to its session and updates the session row."""
+    conn = connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for entry in entries:
+            row = conn.execute(
+                "SELECT message_count FROM chat_sessions WHERE user = ? AND id = ?",
+                (username, entry["id"])).fetchone()
+            start = row[0] if row else 0
+            conn.executemany(
+                "INSERT INTO chat_messages (user, session_id, seq, payload) VALUES (?, ?, ?, ?)",
+                [(username, entry["id"], start + i, json.dumps(message))
+                 for i, message in enumerate(entry["messages"])])
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions "
+                "(user, id, title, timestamp, date, message_count) VALUES (?, ?, ?, ?, ?, ?)",
+                (username, entry["id"], entry.get("title"), entry.get("timestamp"),
+                 entry.get("date"), start + len(entry["messages"])))
+
+
+def clear_sessions(username):
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM chat_messages WHERE user = ?", (username,))
+        conn.execute("DELETE FROM chat_sessions WHERE user = ?", (username,))
+
+
+# -----------------------------------------------------------------------------
+# Users
+# -----------------------------------------------------------------------------
+_USER_COLUMNS = ("password_hash", "created_at", "role")
+
+
+def _user_row(username, record):
+    extra = {k: v for k, v in record.items() if k not in _USER_COLUMNS}
+    return (username, record["password_hash"], record.get("created_at"),
+            record.get("role") or "patient", json.dumps(extra))
+
+
+def _user_record(password_hash, created_at, role, payload):
+    record = json.loads(payload or "{}")
+    record.update({"password_hash": password_hash, "created_at": created_at, "role": role})
+    return record
+
+
+def get_user(username):
+    row = connect().execute(
+        "SELECT password_hash, created_at, role, payload FROM users WHERE username = ?",
+        (username,)).fetchone()
+    return _user_record(*row) if row else None
+
+
+def create_user(username, record):
+    """Inserts one account; returns False if the username is taken."""
+    conn = connect()
+    with conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO users (username, password_hash, created_at, role, payload) "
+            "VALUES (?, ?, ?, ?, ?)", _user_row(username, record))
+    return cur.rowcount == 1
+
+
+def load_users_db():
+    rows = connect().execute(
+        "SELECT username, password_hash, created_at, role, payload FROM users")
+    return {username: _user_record(*rest) for username, *rest in rows}
+
+
+def save_users_db(db):
+    conn = connect()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO users (username, password_hash, created_at, role, payload) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [_user_row(username, record) for username, record in db.items()])
+
+
+# -----------------------------------------------------------------------------
+# One-shot import of the JSON file store
+# -----------------------------------------------------------------------------
+def import_json_store():
+    """Copies data/users_db.json and every user's JSON notes and chat sessions into SQLite."""
+    from storage import journal, sessions, users
+
+    save_users_db(users.load_json_users_db())
+    imported = {}
+    conn = connect()
+    for user_dir in sorted(glob.glob(os.path.join(DATA_DIR, "users", "*"))):
+        if not os.path.isdir(user_dir):
+            continue
+        username = os.path.basename(user_dir)
+        # Folds the journal (migrating a legacy notes.json first) and adds
+        # the archived months.
+        notes = journal.read_all_notes(username)
+        for note in notes:
+            note.setdefault("id", uuid.uuid4().hex)
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO notes (user, id, timestamp, date, mode, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [_note_row(username, note) for note in notes])
+            _bump_version(conn, username)
+            conn.execute("DELETE FROM chat_messages WHERE user = ?", (username,))
+            conn.execute("DELETE FROM chat_sessions WHERE user = ?", (username,))
+        append_session_messages(username, sessions.read_json_sessions(username))
+        imported[username] = len(notes)
+    return imported
@@ -0,0 +1,107 @@
+"""
+Users database. Follows the same ``STORAGE_BACKEND`` switch as the notes.
+
+Accounts are looked up and inserted one record at a time: with the file
+engine each account is ``data/users/<name>/account.json``, created with an
+exclusive open so two registrations of the same name cannot both succeed;
+with SQLite it is a row keyed by username. Neither depends on how many users
+exist. A legacy ``data/users_db.json`` is split into account files once; the
+file itself is left in place (it is checked in) and ``data/users/.migrated``
+records that it has been read, so later starts never open it again.
+"""
+import glob
+import json
+import os
+
+from storage import sqlite_backend
+from storage.atomic import locked
+from storage.paths import DATA_DIR, safe_username, user_data_dir
+
+USERS_DB_FILE = os.path.join(DATA_DIR, "users_db.json")
+ACCOUNT_FILE = "account.json"
+MIGRATED_MARKER = os.path.join(DATA_DIR, "users", ".migrated")
+DEFAULT_ROLE = "patient"
+
+_legacy_checked = False
+
+
+def _account_path(username):
+    return os.path.join(user_data_dir(username), ACCOUNT_FILE)
+
+
+def _create_account_file(username, record):
+    try:
+        fd = os.open(_account_path(username), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        json.dump(record, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def _migrate_legacy():
+    """Splits ``users_db.json`` into per-account files, once."""
+    global _legacy_checked
+    if _legacy_checked:
+        return
+    if os.path.exists(USERS_DB_FILE) and not os.path.exists(MIGRATED_MARKER):
+        with locked(USERS_DB_FILE):
+            if not os.path.exists(MIGRATED_MARKER):
+                try:
+                    with open(USERS_DB_FILE, "r") as f:
+                        db = json.load(f)
+                except ValueError:
+                    db = {}
+                for username, record in db.items():
+                    record.setdefault("role", DEFAULT_ROLE)
+                    _create_account_file(username, record)
+                # Written last, so an interrupted split is redone (the account
+                # files are created exclusively, so finished ones are kept).
+                os.makedirs(os.path.dirname(MIGRATED_MARKER), exist_ok=True)
+                with open(MIGRATED_MARKER, "w"):
+                    pass
+    _legacy_checked = True
+
+
+def get_user(username):
+    """The account record for ``username``, or None."""
+    if sqlite_backend.enabled():
+        return sqlite_backend.get_user(username)
+    _migrate_legacy()
+    if safe_username(username) != username:
+        return None
+    try:
+        with open(os.path.join(DATA_DIR, "users", username, ACCOUNT_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def create_user(username, password_hash, created_at, role=DEFAULT_ROLE):
+    """Inserts one account; returns False if the name is taken."""
+    record = {"password_hash": password_hash, "created_at": created_at, "role": role}
+    if sqlite_backend.enabled():
+        return sqlite_backend.create_user(username, record)
+    _migrate_legacy()
+    return _create_account_file(username, record)
+
+
+def load_json_users_db():
+    """Every account in the file engine, for the SQLite import."""
+    _migrate_legacy()
+    db = {}
+    for path in glob.glob(os.path.join(DATA_DIR, "users", "*", ACCOUNT_FILE)):
+        try:
+            with open(path, "r") as f:
+                db[os.path.basename(os.path.dirname(path))] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return db
+
+
+def load_users_db():
+    if sqlite_backend.enabled():
+        return sqlite_backend.load_users_db()
+    return load_json_users_db()
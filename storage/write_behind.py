@@ -0,0 +1,171 @@
+"""
+Write-behind persistence queue.
+
+Saves are recorded in memory and handed to a background writer thread that
+persists them per user in batches, every ``interval`` seconds and at process
+exit. Repeated saves of the same note id coalesce into one write: the newer
+one replaces the older, or, with a ``merge(older, newer)`` function (chat
+message deltas), the two are combined. Until a save is on disk,
+``pending(username)`` returns it so readers still see their own writes; a
+user's entries stop being in flight as soon as that user's write lands.
+
+A full queue makes ``submit``/``update`` wait for room, but only for
+``max_wait`` seconds: if persisting keeps failing (a full disk), they raise
+WriteBehindError, chained to the last persist error, instead of hanging.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindError(Exception):
+    pass
+
+
+class WriteBehindQueue:
+    def __init__(self, persist, max_pending=1000, interval=0.25, merge=None, max_wait=5.0):
+        self._persist = persist          # persist(username, [note, ...])
+        self._merge = merge or (lambda older, newer: newer)
+        self._max_pending = max_pending
+        self._interval = interval
+        self._max_wait = max_wait
+        self._last_error = None          # of the latest failed persist, until one succeeds
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = {}               # username -> OrderedDict(id -> note)
+        self._in_flight = {}             # same shape, being persisted right now
+        self._count = 0
+        self._thread = None
+        atexit.register(self.flush)
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _enqueue(self, username, note):
+        # Caller holds self._cond.
+        user_pending = self._pending.setdefault(username, OrderedDict())
+        if note["id"] in user_pending:
+            note = self._merge(user_pending.pop(note["id"]), note)
+        else:
+            self._count += 1
+        user_pending[note["id"]] = note
+        if self._count >= self._max_pending:
+            self._cond.notify_all()
+
+    def _wait_for_room(self):
+        # Caller holds self._cond. Bounded queue: apply backpressure when full.
+        deadline = time.monotonic() + self._max_wait
+        while self._count >= self._max_pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise WriteBehindError(
+                    f"{self._count} saves still queued after {self._max_wait:g} s") from self._last_error
+            self._cond.notify_all()
+            self._cond.wait(min(self._interval, remaining))
+
+    def submit(self, username, note):
+        with self._cond:
+            self._start()
+            self._wait_for_room()
+            self._enqueue(username, note)
+        return note
+
+    def update(self, username, note_id, mutate, load_stored):
+        """
+        Queues ``mutate(current)``; ``current`` is the newest pending version,
+        or ``load_stored()`` when nothing is queued for that id.
+        """
+        with self._cond:
+            self._start()
+            self._wait_for_room()
+            current = self._lookup(username, note_id)
+            if current is None:
+                current = load_stored()
+            note = mutate(current)
+            note["id"] = note_id
+            self._enqueue(username, note)
+        return note
+
+    def _lookup(self, username, note_id):
+        for source in (self._pending, self._in_flight):
+            note = source.get(username, {}).get(note_id)
+            if note is not None:
+                return note
+        return None
+
+    def pending(self, username):
+        """Notes saved by this process but not yet on disk, oldest first."""
+        with self._cond:
+            merged = OrderedDict(self._in_flight.get(username, {}))
+            for note_id, note in self._pending.get(username, {}).items():
+                merged.pop(note_id, None)
+                merged[note_id] = note
+        return list(merged.values())
+
+    def queued(self, username):
+        """In-flight entries followed by pending ones, without merging equal ids."""
+        with self._cond:
+            return (list(self._in_flight.get(username, {}).values())
+                    + list(self._pending.get(username, {}).values()))
+
+    def discard(self, username):
+        with self._cond:
+            dropped = self._pending.pop(username, None)
+            if dropped:
+                self._count -= len(dropped)
+                self._cond.notify_all()
+
+    def _drain(self):
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending:
+                    return False
+                batch, self._pending = self._pending, {}
+                self._in_flight = dict(batch)
+            failed = {}
+            for username, notes in batch.items():
+                try:
+                    self._persist(username, list(notes.values()))
+                except Exception as e:
+                    logger.exception("Write-behind flush failed for %s; will retry", username)
+                    failed[username] = notes
+                    self._last_error = e
+                    continue
+                with self._cond:
+                    self._last_error = None
+                    # On disk now; readers must not see these twice.
+                    self._in_flight.pop(username, None)
+                    self._count -= len(notes)
+                    self._cond.notify_all()
+            with self._cond:
+                for username, notes in failed.items():
+                    # Re-queue ahead of anything submitted meanwhile, folding
+                    # the newer entry for the same id into the failed one.
+                    user_pending = self._pending.setdefault(username, OrderedDict())
+                    for note_id, note in reversed(list(notes.items())):
+                        if note_id in user_pending:
+                            user_pending[note_id] = self._merge(note, user_pending[note_id])
+                            self._count -= 1
+                        else:
+                            user_pending[note_id] = note
+                            user_pending.move_to_end(note_id, last=False)
+                self._in_flight = {}
+                self._cond.notify_all()
+            return not failed
+
+    def flush(self):
+        """Persists everything queued so far, in the calling thread."""
+        while self._drain():
+            pass
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self._interval)
+            self._drain()